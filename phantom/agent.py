@@ -3,6 +3,7 @@ import math
 import pickle
 import random
 from collections.abc import Mapping, Sequence
+from concurrent.futures import ThreadPoolExecutor
 from typing import TYPE_CHECKING
 
 import numpy as np
@@ -27,6 +28,7 @@ from phantom.common.constants import (
     RESULT_TO_FITNESS,
 )
 from phantom.common.cost import Cost
+from phantom.common.distribute import AssignmentSession
 from phantom.common.metrics import MetricAccumulator
 from phantom.common.utils import MacroId, calculate_cost_efficiency, to_point
 from phantom.learn.parameters import OptimizationTarget, ParameterManager, Prior
@@ -39,6 +41,7 @@ from phantom.micro.corrosive_bile import CorrosiveBile
 from phantom.micro.creep import CreepSpread, CreepTumors
 from phantom.micro.dodge import Dodge
 from phantom.micro.overseers import Overseers
+from phantom.micro.pathing import are_positions_safe
 from phantom.micro.queens import Queens
 from phantom.micro.simulator import CombatSimulator, CombatSimulatorParameters
 
@@ -64,6 +67,11 @@ class Agent:
         self.queens = Queens(bot)
         self.strategy_paramaters = StrategyParameters(self.optimizer)
         self.mining = MiningState(bot, self.optimizer)
+        self.assignment_executor = (
+            ThreadPoolExecutor(config.assignment_workers, thread_name_prefix="assignment")
+            if config.assignment_workers
+            else None
+        )
         self.build_order_completed = False
         self.gas_ratio = 0.0
         self.tech_priority_transform = self.optimizer.optimize[OptimizationTarget.CostEfficiency].add_scalar_transform(
@@ -166,13 +174,10 @@ class Agent:
         self.dodge.on_step()
         self.blocked_positions.on_step()
 
-        def should_harvest_resource(r: Unit) -> bool:
-            p = to_point(r.position)
-            return self.bot.mediator.is_position_safe(
-                grid=self.bot.ground_grid,
-                position=self.bot.gather_targets[p],
-                weight_safety_limit=6.0,
-            )
+        def filter_safe_resources(resources: Sequence[Unit]) -> list[Unit]:
+            gather_targets = np.array([self.bot.gather_targets[to_point(r.position)] for r in resources])
+            safe = are_positions_safe(self.bot.ground_grid, gather_targets, weight_safety_limit=6.0)
+            return [r for r, is_safe in zip(resources, safe.tolist(), strict=True) if is_safe]
 
         required = Cost()
         required += self.builder.get_planned_cost()
@@ -201,8 +206,8 @@ class Agent:
             self.builder.add(item, plan)
         self.builder.on_step()
 
-        mineral_fields = [m for m in self.bot.all_taken_minerals if should_harvest_resource(m)]
-        gas_buildings = [g for g in self.bot.harvestable_gas_buildings if should_harvest_resource(g)]
+        mineral_fields = filter_safe_resources(self.bot.all_taken_minerals)
+        gas_buildings = filter_safe_resources(self.bot.harvestable_gas_buildings)
 
         resoure_observation = MiningContext(
             self.bot,
@@ -251,14 +256,25 @@ class Agent:
             if structure.health_percentage < 0.05:
                 actions[structure] = UseAbility(AbilityId.CANCEL)
 
-        actions.update(self._micro_queens(queens, combat))
+        should_inject = self.bot.supply_used + self.bot.bank.larva < 200
+        assignments = AssignmentSession(self.assignment_executor)
+        inject_assignment = self.queens.assign_injects(
+            assignments, queens, self.bot.townhalls.ready if should_inject else []
+        )
+        detection_assignment, scout_assignment = self.overseers.assign_targets(
+            assignments,
+            overseers=overseers,
+            scout_targets=enemy_combatants or self.bot.all_enemy_units,
+            detection_targets=list(map(Point2, self.blocked_positions.blocked_positions)),
+        )
+        assignments.solve()
 
-        detection_targets = list(map(Point2, self.blocked_positions.blocked_positions))
+        actions.update(self._micro_queens(queens, inject_assignment.result(), combat))
         actions.update(
             self.overseers.get_actions(
                 overseers=overseers,
-                scout_targets=enemy_combatants or self.bot.all_enemy_units,
-                detection_targets=detection_targets,
+                detection_assignment=detection_assignment.result(),
+                scout_assignment=scout_assignment.result(),
                 combat=combat,
             )
         )
@@ -287,6 +303,11 @@ class Agent:
             self.creep_tumors.on_tumor_completed(unit, previous_type == UnitTypeId.CREEPTUMORQUEEN)
 
     def on_end(self, game_result: Result):
+        self.combat.shutdown()
+        if self.assignment_executor:
+            self.assignment_executor.shutdown(wait=False, cancel_futures=True)
+        engage_cache = self.simulator.engage_cache
+        logger.info(f"Engagement prediction cache: {engage_cache.hit_rate=:.2f}, {engage_cache.expirations=}")
         if self.config.training:
             cost_efficiency = calculate_cost_efficiency(self.bot.state.score)
             result_value = RESULT_TO_FITNESS[game_result]
@@ -301,8 +322,9 @@ class Agent:
             with lzma.open(self.config.params_path, "wb") as f:
                 pickle.dump(optimizer_state, f)
 
-    def _micro_queens(self, queens: Sequence[Unit], combat: CombatStep) -> Mapping[Unit, Action]:
-        should_inject = self.bot.supply_used + self.bot.bank.larva < 200
+    def _micro_queens(
+        self, queens: Sequence[Unit], inject_assignment: Mapping[Unit, Unit], combat: CombatStep
+    ) -> Mapping[Unit, Action]:
         tumor_count = (
             self.creep_tumors.unspread_tumor_count
             + self.bot.count_pending(UnitTypeId.CREEPTUMOR)
@@ -312,7 +334,7 @@ class Agent:
         should_spread_creep = tumor_count < tumor_limit and self.bot.mediator.get_creep_coverage < 90
         actions = self.queens.get_actions(
             queens=queens,
-            inject_targets=self.bot.townhalls.ready if should_inject else [],
+            inject_assignment=inject_assignment,
             creep=self.creep_spread if should_spread_creep else None,
             combat=combat,
         )
@@ -0,0 +1,111 @@
+import time
+from dataclasses import dataclass
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+
+@dataclass(frozen=True)
+class AuctionResult:
+    indices: np.ndarray
+    cost: float
+    lower_bound: float
+    converged: bool
+    rounds: int
+
+    @property
+    def gap(self) -> float:
+        """Duality gap, an upper bound on how far the assignment is from optimal."""
+        return max(0.0, self.cost - self.lower_bound)
+
+
+def _complete(cost: np.ndarray, indices: np.ndarray, owner: np.ndarray) -> np.ndarray:
+    """Match the unassigned rows to the free columns, penalty entries are only taken if nothing else fits."""
+    indices = indices.copy()
+    rows = np.flatnonzero(indices < 0)
+    columns = np.flatnonzero(owner < 0)
+    matched_rows, matched_columns = linear_sum_assignment(cost[np.ix_(rows, columns)])
+    indices[rows[matched_rows]] = columns[matched_columns]
+    return indices
+
+
+def auction_assignment(
+    cost: np.ndarray,
+    deadline: float | None = None,
+    tolerance: float = 1e-3,
+    scaling: float = 4.0,
+) -> AuctionResult:
+    """
+    Assign every row to a distinct column by epsilon-scaling Jacobi auction, minimizing total cost.
+    Stops at the absolute time.perf_counter() deadline, if given, and returns the best assignment found so far.
+    Converged results are within tolerance times the cost spread of the optimum.
+    """
+    n, s = cost.shape
+    if n > s:
+        raise ValueError(f"Cannot assign {n} rows to {s} columns")
+    if n == 0:
+        return AuctionResult(np.zeros(0, dtype=int), 0.0, 0.0, True, 0)
+    if not np.isfinite(cost).all():
+        raise ValueError("Auction requires finite cost")
+    if n < s:
+        # pad to a square problem, the bounds are only valid when every column is taken
+        result = auction_assignment(np.vstack((cost, np.zeros((s - n, s)))), deadline, tolerance, scaling)
+        return AuctionResult(result.indices[:n], result.cost, result.lower_bound, result.converged, result.rounds)
+
+    rows = np.arange(n)
+    spread = float(cost.max() - cost.min())
+    if not np.isfinite(spread):
+        raise ValueError("Auction cost spread overflows")
+    epsilon_min = max(tolerance * spread, 1e-9) / n
+    epsilon = max(spread / 2, epsilon_min)
+    prices = np.zeros(s)
+
+    best: np.ndarray | None = None
+    best_cost = np.inf
+    lower_bound = -np.inf
+    rounds = 0
+    while True:
+        owner = np.full(s, -1)
+        indices = np.full(n, -1)
+        timed_out = False
+        while (bidders := np.flatnonzero(indices < 0)).size:
+            if deadline is not None and time.perf_counter() > deadline:
+                timed_out = True
+                break
+            with np.errstate(over="ignore", invalid="ignore"):
+                values = -cost[bidders] - prices
+                first = values.argmax(axis=1)
+                first_value = values[np.arange(len(bidders)), first]
+                values[np.arange(len(bidders)), first] = -np.inf
+                second_value = values.max(axis=1) if s > 1 else first_value
+                bids = prices[first] + first_value - second_value + epsilon
+            # costs close to the float limit push the prices past it
+            if not np.isfinite(bids).all():
+                raise ValueError("Auction prices overflow")
+
+            # the highest bid on each column wins
+            order = np.lexsort((bids, first))
+            is_highest = np.append(first[order][1:] != first[order][:-1], True)
+            winners = order[is_highest]
+            won = first[winners]
+            outbid = owner[won]
+            indices[outbid[outbid >= 0]] = -1
+            owner[won] = bidders[winners]
+            indices[bidders[winners]] = won
+            prices[won] = bids[winners]
+            rounds += 1
+
+        # any nonnegative prices give a lower bound by weak duality
+        lower_bound = max(lower_bound, float((cost + prices).min(axis=1).sum() - prices.sum()))
+        if timed_out:
+            indices = _complete(cost, indices, owner)
+        indices_cost = float(cost[rows, indices].sum())
+        if indices_cost < best_cost:
+            best, best_cost = indices, indices_cost
+        if timed_out or epsilon <= epsilon_min:
+            break
+        epsilon = max(epsilon / scaling, epsilon_min)
+
+    if best is None:
+        raise ValueError("Auction did not reach a finite assignment")
+    return AuctionResult(best, best_cost, min(lower_bound, best_cost), not timed_out, rounds)
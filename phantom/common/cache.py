@@ -0,0 +1,78 @@
+import math
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import Generic, TypeVar
+
+TKey = TypeVar("TKey", bound=Hashable)
+TValue = TypeVar("TValue")
+
+
+class LRUCache(Generic[TKey, TValue]):
+    """
+    Least recently used cache bounded by the total size of its items, one unit per item by default.
+    Items older than the time to live by the given clock count as missing and are dropped when looked up.
+    """
+
+    def __init__(
+        self,
+        capacity: float,
+        size_of: Callable[[TValue], float] | None = None,
+        ttl: float = math.inf,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.capacity = capacity
+        self.size_of = size_of or (lambda _: 1.0)
+        self.ttl = ttl
+        self.clock = clock
+        self.size = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._items = OrderedDict[TKey, tuple[TValue, float, float]]()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, key: TKey) -> bool:
+        return (item := self._items.get(key)) is not None and self.clock() < item[2]
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, key: TKey) -> TValue | None:
+        if (item := self._items.get(key)) is None:
+            self.misses += 1
+            return None
+        if item[2] <= self.clock():
+            self.pop(key)
+            self.misses += 1
+            self.expirations += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return item[0]
+
+    def put(self, key: TKey, value: TValue) -> None:
+        self.pop(key)
+        item_size = self.size_of(value)
+        self._items[key] = value, item_size, self.clock() + self.ttl
+        self.size += item_size
+        # the newest item is kept even if it exceeds the capacity on its own
+        while self.size > self.capacity and len(self._items) > 1:
+            _, (_, evicted_size, _) = self._items.popitem(last=False)
+            self.size -= evicted_size
+            self.evictions += 1
+
+    def pop(self, key: TKey) -> TValue | None:
+        if (item := self._items.pop(key, None)) is None:
+            return None
+        self.size -= item[1]
+        return item[0]
+
+    def clear(self) -> None:
+        self._items.clear()
+        self.size = 0.0
@@ -19,6 +19,23 @@ class BotConfig:
     params_name = "params.pkl.xz"
     max_actions = 80
     optimizer_pop_size = 20
+    assignment_candidates = 12
+    assignment_drift_threshold = 0.1
+    assignment_workers = 0
+    combat_assignment_deadline: float | None = None
+    targeting_cluster_threshold = 160000
+    targeting_cell_size = 16.0
+    incremental_flow_fields = False
+    bounded_flow_fields = False
+    bounded_field_max_units = 24
+    pathing_workers = 0
+    combat_simulation_float32 = False
+    sparse_simulation_threshold = 256
+    engage_cache_size = 256
+    engage_cache_ttl = 10.0
+    engage_cache_hp_buckets = 4
+    combat_outcome_backend = "sc2_helper"
+    combat_surrogate_path = "models/combat.pkl.xz"
 
     @classmethod
     def from_toml(cls, path: str) -> "BotConfig":
@@ -1,11 +1,21 @@
 import math
-from collections.abc import Hashable, Mapping, Sequence
-from itertools import product
-from typing import TypeVar
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Callable, Hashable, Mapping, Sequence
+from concurrent.futures import Executor, Future
+from dataclasses import dataclass
+from functools import partial
+from typing import Generic, TypeVar
 
 import highspy
 import numpy as np
 from loguru import logger
+from scipy.optimize import linear_sum_assignment, linprog
+from scipy.sparse import coo_array, vstack
+
+from phantom.common.auction import auction_assignment
+from phantom.common.cache import LRUCache
 
 type Point = tuple[int, int]
 
@@ -13,43 +23,78 @@ TKey = TypeVar("TKey", bound=Hashable)
 TValue = TypeVar("TValue", bound=Hashable)
 
 
+@dataclass
+class SolveStats:
+    iterations: int = 0
+    duration: float = 0.0
+    warm: bool = False
+
+
 class HighsPySolver:
-    def __init__(self, n: int, m: int, include_total=True) -> None:
-        logger.info(f"Compiling highspy problem with {n=}, {m=}, {include_total=}")
+    def __init__(self, n: int, m: int, include_total=True, warm_start=True) -> None:
+        logger.info(f"Compiling highspy problem with {n=}, {m=}, {include_total=}, {warm_start=}")
         h = highspy.Highs()
         h.setOptionValue("presolve", "off")
         h.setOptionValue("parallel", "off")
         h.setOptionValue("log_to_console", False)
 
-        vs = {(i, j): h.addVariable(lb=0.0, ub=1.0) for i, j in product(range(n), range(m))}
-        for i in range(n):
-            h.addConstr(sum(vs[i, j] for j in range(m)) == 1.0)
-        for j in range(m):
-            h.addConstr(sum(vs[i, j] for i in range(n)) <= 1.0)
+        # variable (i, j) is column i * m + j with a coefficient in the source row i, the target row n + j
+        # and optionally the total row n + m
+        num_rows = n + m + (1 if include_total else 0)
+        entries_per_column = 3 if include_total else 2
+        sources, targets = np.divmod(np.arange(n * m, dtype=np.int32), m)
+        index = np.stack([sources, n + targets], axis=1)
         if include_total:
-            h.addConstr(sum(vs[i, j] for i in range(n) for j in range(m)) == 1.0)
-        h.minimize(sum(vs[i, j] for i in range(n) for j in range(m)))
+            index = np.concatenate([index, np.full((n * m, 1), n + m, dtype=np.int32)], axis=1)
+
+        lp = highspy.HighsLp()
+        lp.num_col_ = n * m
+        lp.num_row_ = num_rows
+        lp.col_cost_ = np.zeros(n * m)
+        lp.col_lower_ = np.zeros(n * m)
+        lp.col_upper_ = np.ones(n * m)
+        lp.row_lower_ = np.zeros(num_rows)
+        lp.row_upper_ = np.ones(num_rows)
+        lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+        lp.a_matrix_.num_col_ = n * m
+        lp.a_matrix_.num_row_ = num_rows
+        lp.a_matrix_.start_ = np.arange(0, entries_per_column * n * m + 1, entries_per_column, dtype=np.int32)
+        lp.a_matrix_.index_ = index.ravel()
+        lp.a_matrix_.value_ = np.ones(entries_per_column * n * m)
 
         self.n = n
         self.m = m
         self.include_total = include_total
+        self.warm_start = warm_start
         self.highspy = h
-        self.lp = h.getLp()
+        self.lp = lp
+        self.has_basis = False
+        self.model_changed = True
+        self.last_solve = SolveStats()
+        self.solve_count = 0
+        self.iteration_count = 0
+        self.solve_time = 0.0
+        self.total_coeffs = np.full(self.m, np.nan)
+        self.col_indices = np.arange(self.n * self.m, dtype=np.int32)
+        self.row_indices = np.arange(num_rows, dtype=np.int32)
 
-        self.cost = [0.0] * (self.n * self.m)
-        self.row_lower = [1.0] * self.n + [0.0] * self.m
-        self.row_upper = [1.0] * self.n + [0.0] * self.m
+        self.cost = np.zeros(self.n * self.m)
+        self.row_lower = np.concatenate([np.ones(self.n), np.zeros(self.m)])
+        self.row_upper = np.concatenate([np.ones(self.n), np.zeros(self.m)])
 
         if include_total:
-            self.row_lower.append(0.0)
-            self.row_upper.append(0.0)
-            self.a_values = [1.0] * (3 * self.n * self.m)
+            self.row_lower = np.append(self.row_lower, 0.0)
+            self.row_upper = np.append(self.row_upper, 0.0)
+            self.a_values = np.ones(entries_per_column * self.n * self.m)
             self.set_total(np.zeros(self.m), 0)
 
     def set_total(self, coeffs: np.ndarray, limit: int) -> None:
         coeffs = np.pad(coeffs, (0, self.m - coeffs.shape[0]), mode="constant", constant_values=0.0)
-        self.a_values[2::3] = np.tile(coeffs, self.n)
-        self.lp.a_matrix_.value_ = self.a_values
+        if not np.array_equal(coeffs, self.total_coeffs):
+            self.total_coeffs = coeffs
+            self.a_values[2::3] = np.tile(coeffs, self.n)
+            self.lp.a_matrix_.value_ = self.a_values
+            self.model_changed = True
         self.row_lower[-1] = limit
         self.row_upper[-1] = limit
 
@@ -60,43 +105,456 @@ class HighsPySolver:
         cost[n:, m:] = 0.0
         limit = np.pad(limit, (0, self.m - limit.shape[0]), mode="constant", constant_values=n)
 
-        self.cost[:] = cost.flat
+        self.cost[:] = cost.ravel()
         if self.include_total:
             self.row_upper[self.n : -1] = limit
         else:
             self.row_upper[self.n :] = limit
 
-        self.lp.col_cost_ = self.cost
-        self.lp.row_lower_ = self.row_lower
-        self.lp.row_upper_ = self.row_upper
+        if self.has_basis and not self.model_changed:
+            # modify the loaded model in place, HiGHS then starts from the basis of the previous solve
+            self.highspy.changeColsCost(len(self.col_indices), self.col_indices, self.cost)
+            # exposed by highspy at runtime but missing from its stubs
+            self.highspy.changeRowsBounds(  # type: ignore[attr-defined]
+                len(self.row_indices), self.row_indices, self.row_lower, self.row_upper
+            )
+        else:
+            basis = self.highspy.getBasis() if self.has_basis else None
+            self.lp.col_cost_ = self.cost
+            self.lp.row_lower_ = self.row_lower
+            self.lp.row_upper_ = self.row_upper
+            self.highspy.passModel(self.lp)
+            if basis is not None:
+                self.highspy.setBasis(basis)
+            self.model_changed = False
 
-        self.highspy.passModel(self.lp)
+        start = time.perf_counter()
         self.highspy.run()
+        self.last_solve = SolveStats(
+            iterations=self.highspy.getInfo().simplex_iteration_count,
+            duration=time.perf_counter() - start,
+            warm=self.has_basis,
+        )
+        self.solve_count += 1
+        self.iteration_count += self.last_solve.iterations
+        self.solve_time += self.last_solve.duration
+        self.has_basis = self.warm_start and self.highspy.getModelStatus() == highspy.HighsModelStatus.kOptimal
 
         result = self.highspy.getSolution()
         solution = np.reshape(result.col_value, (self.n, self.m))
 
         return solution[:n, :m]
 
+    @property
+    def memory_estimate(self) -> int:
+        # cost, bounds, coefficients and indices per column, held both here and inside HiGHS
+        entries_per_column = 3 if self.include_total else 2
+        return 2 * self.n * self.m * (5 * 8 + 2 * 4 + entries_per_column * (8 + 4))
+
+
+class SolverCache:
+    def __init__(self, budget: int) -> None:
+        self.solvers = LRUCache[Point, HighsPySolver](budget, size_of=lambda s: s.memory_estimate)
+        self.compile_count = 0
+        self.compile_time = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, key: Point) -> HighsPySolver:
+        with self._lock:
+            if (problem := self.solvers.get(key)) is not None:
+                return problem
+        problem = self._compile(key)
+        with self._lock:
+            self.solvers.put(key, problem)
+        return problem
+
+    def _compile(self, key: Point) -> HighsPySolver:
+        start = time.perf_counter()
+        problem = HighsPySolver(*key)
+        with self._lock:
+            self.compile_count += 1
+            self.compile_time += time.perf_counter() - start
+        return problem
+
 
-_PROBLEM_CACHE = dict[Point, HighsPySolver]()
 PROBLEM_RESOLUTION = 8
+PROBLEM_CACHE_BUDGET = 64 * 2**20
+_PROBLEM_CACHE = SolverCache(PROBLEM_CACHE_BUDGET)
 
 
-def get_assignment_solver(n: int, m: int) -> HighsPySolver:
+def _problem_key(n: int, m: int) -> Point:
     n2 = math.ceil(n / PROBLEM_RESOLUTION) * PROBLEM_RESOLUTION
     if n < n2:
         m += 1  # source padding also requires target padding
     m2 = math.ceil(m / PROBLEM_RESOLUTION) * PROBLEM_RESOLUTION
-    key = n2, m2
+    return n2, m2
 
-    if not (problem := _PROBLEM_CACHE.get(key)):
-        if n2 > 100 or m2 > 100:
-            logger.warning(
-                f"Compiling a large assignment problem. Distributing {n} sources to {m} targets, using {n2}x{m2} problem resolution."
-            )
-        _PROBLEM_CACHE[key] = (problem := HighsPySolver(*key))
-    return problem
+
+def has_assignment_solver(n: int, m: int) -> bool:
+    return _problem_key(n, m) in _PROBLEM_CACHE.solvers
+
+
+def get_assignment_solver(n: int, m: int) -> HighsPySolver:
+    key = _problem_key(n, m)
+    n2, m2 = key
+    if key not in _PROBLEM_CACHE.solvers and (n2 > 100 or m2 > 100):
+        logger.warning(
+            f"Compiling a large assignment problem. Distributing {n} sources to {m} targets, using {n2}x{m2} problem resolution."
+        )
+    return _PROBLEM_CACHE.get(key)
+
+
+def get_solver_cache() -> SolverCache:
+    return _PROBLEM_CACHE
+
+
+def prune_candidates(cost: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Keep the k cheapest finite edges per source and per target, returned as sorted (source, target) arrays."""
+    n, m = cost.shape
+    keep = np.zeros((n, m), dtype=bool)
+    if k < m:
+        np.put_along_axis(keep, np.argpartition(cost, k - 1, axis=1)[:, :k], True, axis=1)
+    else:
+        keep[:] = True
+    if k < n:
+        np.put_along_axis(keep, np.argpartition(cost, k - 1, axis=0)[:k, :], True, axis=0)
+    else:
+        keep[:] = True
+    keep &= np.isfinite(cost)
+    return np.nonzero(keep)
+
+
+def _solve_candidates(
+    cost: np.ndarray,
+    limit: np.ndarray,
+    sources: np.ndarray,
+    targets: np.ndarray,
+    total_coeffs: np.ndarray | None,
+    total_limit: int,
+) -> np.ndarray:
+    n, m = cost.shape
+    num_edges = len(sources)
+    include_total = total_coeffs is not None
+    num_rows = n + m + (1 if include_total else 0)
+
+    # every source gets a fallback edge to keep the problem feasible, priced above any assignment over candidates
+    finite_cost = cost[sources, targets]
+    spread = float(finite_cost.max() - finite_cost.min()) if num_edges else 0.0
+    fallback_cost = (n + 1) * (1.0 + spread) + (float(finite_cost.max()) if num_edges else 0.0)
+
+    # edge columns are sorted by source, followed by one fallback column per source
+    edge_index = np.stack([sources, n + targets], axis=1).astype(np.int32)
+    edge_value = np.ones((num_edges, 2))
+    if total_coeffs is not None:
+        edge_index = np.concatenate([edge_index, np.full((num_edges, 1), n + m, dtype=np.int32)], axis=1)
+        edge_value = np.concatenate([edge_value, total_coeffs[targets, None]], axis=1)
+    entries_per_edge = edge_index.shape[1]
+
+    lp = highspy.HighsLp()
+    lp.num_col_ = num_edges + n
+    lp.num_row_ = num_rows
+    lp.col_cost_ = np.concatenate([finite_cost, np.full(n, fallback_cost)])
+    lp.col_lower_ = np.zeros(num_edges + n)
+    lp.col_upper_ = np.ones(num_edges + n)
+    lp.row_lower_ = np.concatenate([np.ones(n), np.zeros(m), [total_limit] if include_total else []])
+    lp.row_upper_ = np.concatenate([np.ones(n), limit, [total_limit] if include_total else []])
+    lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+    lp.a_matrix_.num_col_ = num_edges + n
+    lp.a_matrix_.num_row_ = num_rows
+    lp.a_matrix_.start_ = np.concatenate(
+        [
+            np.arange(0, entries_per_edge * num_edges, entries_per_edge, dtype=np.int32),
+            entries_per_edge * num_edges + np.arange(n + 1, dtype=np.int32),
+        ]
+    )
+    lp.a_matrix_.index_ = np.concatenate([edge_index.ravel(), np.arange(n, dtype=np.int32)])
+    lp.a_matrix_.value_ = np.concatenate([edge_value.ravel(), np.ones(n)])
+
+    h = highspy.Highs()
+    h.setOptionValue("presolve", "off")
+    h.setOptionValue("parallel", "off")
+    h.setOptionValue("log_to_console", False)
+    h.passModel(lp)
+    h.run()
+    return np.asarray(h.getSolution().col_value)[:num_edges]
+
+
+def solve_pruned(
+    cost: np.ndarray,
+    limit: np.ndarray,
+    k: int,
+    total_coeffs: np.ndarray | None = None,
+    total_limit: int = 0,
+) -> np.ndarray:
+    """
+    Solve the assignment over the k nearest candidate edges only.
+    Returns the target index for each source, or -1 if no finite target has capacity left.
+    The result is only optimal if the optimum uses candidate edges alone, on dense matching problems it tends to be a
+    few percent above it. It pays off over the exact matching only when the targets have many units of capacity each.
+    """
+    n, m = cost.shape
+    while True:
+        sources, targets = prune_candidates(cost, k)
+        x = _solve_candidates(cost, limit, sources, targets, total_coeffs, total_limit)
+        indices = np.full(n, -1)
+        chosen = x > 0.5
+        indices[sources[chosen]] = targets[chosen]
+        # widen the candidate set while the solution relies on fallback edges
+        if max(n, m) <= k or not np.isfinite(cost[indices < 0]).any():
+            break
+        k *= 2
+
+    # sources left on their fallback edge take the cheapest target with capacity left
+    if (unassigned := np.flatnonzero(indices < 0)).size:
+        capacity = limit - np.bincount(indices[indices >= 0], minlength=m)
+        for i in unassigned:
+            candidates = np.flatnonzero((capacity >= 1) & np.isfinite(cost[i]))
+            if candidates.size:
+                j = candidates[cost[i, candidates].argmin()]
+                indices[i] = j
+                capacity[j] -= 1
+
+    return indices
+
+
+@dataclass(frozen=True)
+class AssignmentProblem:
+    cost: np.ndarray
+    limit: np.ndarray
+    total_coeffs: np.ndarray | None = None
+    total_limit: int = 0
+    candidates: int | None = None
+    deadline: float | None = None
+
+    @property
+    def shape(self) -> Point:
+        n, m = self.cost.shape
+        return n, m
+
+
+@dataclass(frozen=True)
+class AssignmentStats:
+    backend: str
+    n: int
+    m: int
+    duration: float
+    gap: float = 0.0
+
+
+class AssignmentBackend(ABC):
+    name: str
+    last_gap = 0.0
+
+    @abstractmethod
+    def solve(self, problem: AssignmentProblem) -> np.ndarray:
+        """Return the target index for each source, or -1 for unassigned sources."""
+        raise NotImplementedError
+
+
+def _finite_cost(cost: np.ndarray) -> np.ndarray:
+    """Replace infinite entries with a penalty above any finite assignment, for solvers that reject them."""
+    finite = np.isfinite(cost)
+    if finite.all():
+        return cost
+    scale = np.abs(cost[finite]).max() if finite.any() else 0.0
+    return np.where(finite, cost, (1.0 + scale) * (cost.shape[0] + 1))
+
+
+def _matching_to_indices(problem: AssignmentProblem, rows: np.ndarray, columns: np.ndarray) -> np.ndarray:
+    indices = np.full(problem.shape[0], -1)
+    indices[rows] = columns
+    indices[np.isinf(problem.cost[np.arange(len(indices)), indices]) & (indices >= 0)] = -1
+    return indices
+
+
+class NearestBackend(AssignmentBackend):
+    """Targets without effective capacity limit, every source takes its cheapest target."""
+
+    name = "nearest"
+
+    def solve(self, problem: AssignmentProblem) -> np.ndarray:
+        indices = problem.cost.argmin(axis=1)
+        indices[np.isinf(problem.cost.min(axis=1))] = -1
+        return indices
+
+
+class HungarianBackend(AssignmentBackend):
+    """One-to-one matching."""
+
+    name = "hungarian"
+
+    def solve(self, problem: AssignmentProblem) -> np.ndarray:
+        rows, columns = linear_sum_assignment(_finite_cost(problem.cost))
+        return _matching_to_indices(problem, rows, columns)
+
+
+class TransportBackend(AssignmentBackend):
+    """
+    Capacitated assignment as min-cost flow.
+    With unit supply per source, the flow network reduces to a matching against one copy of each target per unit of
+    capacity, solved by the shortest augmenting path routine in scipy.
+    """
+
+    name = "transport"
+
+    def solve(self, problem: AssignmentProblem) -> np.ndarray:
+        n, m = problem.shape
+        copies = np.clip(np.floor(problem.limit), 0, n).astype(int)
+        targets = np.repeat(np.arange(m), copies)
+        rows, columns = linear_sum_assignment(_finite_cost(problem.cost[:, targets]))
+        return _matching_to_indices(problem, rows, targets[columns])
+
+
+class AuctionBackend(AssignmentBackend):
+    """
+    Capacitated assignment by epsilon-scaling auction against one copy of each target per unit of capacity.
+    Stops after the problem deadline in seconds, if any, and reports the duality gap of the result.
+    Falls back to the exact transport backend if the auction fails on the given cost.
+    """
+
+    name = "auction"
+
+    def solve(self, problem: AssignmentProblem) -> np.ndarray:
+        n, m = problem.shape
+        deadline = None if problem.deadline is None else time.perf_counter() + problem.deadline
+        copies = np.clip(np.floor(problem.limit), 0, n).astype(int)
+        targets = np.repeat(np.arange(m), copies)
+        # leaving a source unassigned is allowed at a penalty
+        unassigned = np.full((n, max(0, n - len(targets))), np.inf)
+        try:
+            result = auction_assignment(_finite_cost(np.hstack((problem.cost[:, targets], unassigned))), deadline)
+        except ValueError as error:
+            logger.warning(f"{error=} in auction assignment, falling back to transport")
+            self.last_gap = 0.0
+            return BACKENDS[TransportBackend.name].solve(problem)
+        self.last_gap = result.gap
+        rows = np.flatnonzero(result.indices < len(targets))
+        return _matching_to_indices(problem, rows, targets[result.indices[rows]])
+
+
+class HighsBackend(AssignmentBackend):
+    """General LP with a side constraint on the total, solved with a cached HiGHS model."""
+
+    name = "highs"
+
+    @staticmethod
+    def solver_shape(problem: AssignmentProblem) -> Point:
+        n, m = problem.shape
+        return n, m + 1 if np.floor(problem.limit).sum() < n else m
+
+    def solve(self, problem: AssignmentProblem) -> np.ndarray:
+        n, m = problem.shape
+        cost, limit, total_coeffs = problem.cost, problem.limit, problem.total_coeffs
+        if total_coeffs is None:
+            total_coeffs = np.zeros(m)
+        if overflow := np.floor(limit).sum() < n:
+            # sources that do not fit go to an extra target at a penalty
+            cost = _finite_cost(np.hstack((cost, np.full((n, 1), np.inf))))
+            limit = np.append(limit, n)
+            total_coeffs = np.append(total_coeffs, 0.0)
+        solver = get_assignment_solver(*cost.shape)
+        solver.set_total(total_coeffs, problem.total_limit)
+        x = solver.solve(cost, limit)
+        indices = x.argmax(axis=1)
+        if overflow:
+            return _matching_to_indices(problem, *np.nonzero(indices[:, None] == np.arange(m)))
+        return indices
+
+
+class PrunedBackend(AssignmentBackend):
+    """Sparse LP over the nearest candidate edges, approximate, see solve_pruned."""
+
+    name = "pruned"
+
+    def solve(self, problem: AssignmentProblem) -> np.ndarray:
+        return solve_pruned(
+            problem.cost,
+            problem.limit,
+            problem.candidates or max(problem.shape),
+            problem.total_coeffs,
+            problem.total_limit,
+        )
+
+
+BACKENDS: dict[str, AssignmentBackend] = {
+    backend.name: backend
+    for backend in (
+        NearestBackend(),
+        HungarianBackend(),
+        TransportBackend(),
+        AuctionBackend(),
+        HighsBackend(),
+        PrunedBackend(),
+    )
+}
+
+
+# measured crossovers, see scripts/benchmark_assignment.py
+DENSE_LP_MAX_SIZE = 4096
+DENSE_MATCHING_MAX_SIZE = 2**20
+PRUNED_MIN_CAPACITY = 5
+
+
+def select_backend(problem: AssignmentProblem) -> AssignmentBackend:
+    n, m = problem.shape
+    prune = problem.candidates is not None and problem.candidates < max(n, m)
+    if problem.total_coeffs is not None and problem.total_coeffs.any():
+        # a cached HiGHS model warm starts from the previous solve and beats the pruned LP, which is built from scratch
+        # every time, but compiling one only pays off for moderate sizes
+        if prune and n * m > DENSE_LP_MAX_SIZE and not has_assignment_solver(*HighsBackend.solver_shape(problem)):
+            return BACKENDS[PrunedBackend.name]
+        return BACKENDS[HighsBackend.name]
+    elif (problem.limit >= n).all():
+        return BACKENDS[NearestBackend.name]
+    elif problem.deadline is not None:
+        return BACKENDS[AuctionBackend.name]
+    elif (
+        prune
+        and (copies := np.clip(np.floor(problem.limit), 0, n).sum()) >= PRUNED_MIN_CAPACITY * m
+        and n * copies > DENSE_MATCHING_MAX_SIZE
+    ):
+        # the matching backends expand the cost to one column per unit of capacity, without that expansion they are
+        # faster than the pruned LP and exact
+        return BACKENDS[PrunedBackend.name]
+    elif (problem.limit == 1).all():
+        return BACKENDS[HungarianBackend.name]
+    else:
+        return BACKENDS[TransportBackend.name]
+
+
+def solve_assignment(
+    problem: AssignmentProblem,
+    backend: str | None = None,
+    stats_hook: Callable[[AssignmentStats], None] | None = None,
+) -> np.ndarray:
+    if np.isnan(problem.cost).any():
+        raise ValueError("NaN values are not valid for assignment cost")
+    selected = BACKENDS[backend] if backend else select_backend(problem)
+    start = time.perf_counter()
+    indices = selected.solve(problem)
+    if stats_hook:
+        stats_hook(AssignmentStats(selected.name, *problem.shape, time.perf_counter() - start, selected.last_gap))
+    return indices
+
+
+def _assignment_problem(
+    cost: np.ndarray,
+    max_assigned: np.ndarray | int | None,
+    candidates: int | None,
+    deadline: float | None,
+) -> AssignmentProblem:
+    n, m = cost.shape
+    if max_assigned is None:
+        max_assigned = math.ceil(n / m)
+    if isinstance(max_assigned, int):
+        max_assigned = np.full(m, float(max_assigned))
+    return AssignmentProblem(cost, max_assigned, candidates=candidates, deadline=deadline)
+
+
+def _indices_to_mapping(
+    a: Sequence[TKey], b: Sequence[TValue], cost: np.ndarray, indices: np.ndarray
+) -> Mapping[TKey, TValue]:
+    return {ai: b[j] for (i, ai), j in zip(enumerate(a), indices, strict=False) if j >= 0 and cost[i, j] < np.inf}
 
 
 def distribute(
@@ -104,6 +562,10 @@ def distribute(
     b: Sequence[TValue],
     cost: np.ndarray,
     max_assigned: np.ndarray | int | None = None,
+    candidates: int | None = None,
+    backend: str | None = None,
+    stats_hook: Callable[[AssignmentStats], None] | None = None,
+    deadline: float | None = None,
 ) -> Mapping[TKey, TValue]:
     n = len(a)
     m = len(b)
@@ -111,17 +573,332 @@ def distribute(
         return {}
     if m == 0:
         return {}
-    if max_assigned is None:
-        max_assigned = math.ceil(n / m)
-    if isinstance(max_assigned, int):
-        max_assigned = np.full(m, float(max_assigned))
-    if np.isnan(cost).any():
-        raise ValueError("NaN values are not valid for assignment cost")
-    solver = get_assignment_solver(n, m)
+    problem = _assignment_problem(cost, max_assigned, candidates, deadline)
+    indices = solve_assignment(problem, backend, stats_hook)
+    return _indices_to_mapping(a, b, cost, indices)
+
+
+def block_diagonal(problems: Sequence[AssignmentProblem]) -> AssignmentProblem:
+    """Combine problems without side constraints into one, with infinite cost across blocks."""
+    n = sum(p.shape[0] for p in problems)
+    m = sum(p.shape[1] for p in problems)
+    cost = np.full((n, m), np.inf)
+    i = j = 0
+    for problem in problems:
+        ni, mi = problem.shape
+        cost[i : i + ni, j : j + mi] = problem.cost
+        i += ni
+        j += mi
+    return AssignmentProblem(cost, np.concatenate([p.limit for p in problems]))
+
+
+# merging only saves the model setup of the LP, the scipy matchings pay for the padding without saving anything
+BLOCK_BACKENDS = frozenset({HighsBackend.name})
+
+
+def completed_future[T](value: T) -> Future[T]:
+    future = Future[T]()
+    future.set_result(value)
+    return future
+
+
+@dataclass
+class _PendingAssignment:
+    problem: AssignmentProblem
+    backend: str | None
+    result: Future[np.ndarray]
+
+
+class AssignmentSession:
+    """
+    Collects the independent assignment problems of a frame and solves them together.
+    Problems for the HiGHS backend are merged into one block-diagonal problem, the rest is solved on the executor if
+    given.
+    """
+
+    def __init__(self, executor: Executor | None = None) -> None:
+        self.executor = executor
+        self._pending = list[_PendingAssignment]()
+
+    def submit(
+        self,
+        a: Sequence[TKey],
+        b: Sequence[TValue],
+        cost: np.ndarray,
+        max_assigned: np.ndarray | int | None = None,
+        candidates: int | None = None,
+        backend: str | None = None,
+    ) -> Future[Mapping[TKey, TValue]]:
+        if not a or not b:
+            return completed_future({})
+        result = Future[Mapping[TKey, TValue]]()
+        if np.isnan(cost).any():
+            result.set_exception(ValueError("NaN values are not valid for assignment cost"))
+            return result
+        pending = _PendingAssignment(_assignment_problem(cost, max_assigned, candidates, None), backend, Future())
+
+        def resolve(indices: Future[np.ndarray]) -> None:
+            # exceptions raised inside a done callback are swallowed, so a failed solve has to be forwarded
+            if (error := indices.exception()) is not None:
+                result.set_exception(error)
+            else:
+                result.set_result(_indices_to_mapping(a, b, cost, indices.result()))
+
+        pending.result.add_done_callback(resolve)
+        self._pending.append(pending)
+        return result
+
+    def solve(self) -> None:
+        pending, self._pending = self._pending, []
+        blocks = dict[str, list[_PendingAssignment]]()
+        single = list[_PendingAssignment]()
+        for item in pending:
+            backend = item.backend or select_backend(item.problem).name
+            if backend in BLOCK_BACKENDS:
+                blocks.setdefault(backend, []).append(item)
+            else:
+                single.append(item)
+
+        for backend, items in blocks.items():
+            if len(items) == 1:
+                single.extend(items)
+                continue
+            try:
+                indices = solve_assignment(block_diagonal([item.problem for item in items]), backend)
+            except Exception as error:
+                for item in items:
+                    item.result.set_exception(error)
+                continue
+            i = j = 0
+            for item in items:
+                ni, mi = item.problem.shape
+                block_indices = indices[i : i + ni] - j
+                block_indices[(block_indices < 0) | (block_indices >= mi)] = -1
+                item.result.set_result(block_indices)
+                i += ni
+                j += mi
+
+        for item in single:
+            if self.executor:
+                solution = self.executor.submit(solve_assignment, item.problem, item.backend)
+                solution.add_done_callback(partial(_forward, target=item.result))
+            else:
+                try:
+                    item.result.set_result(solve_assignment(item.problem, item.backend))
+                except Exception as error:
+                    item.result.set_exception(error)
+
+
+def _forward(source: Future[np.ndarray], target: Future[np.ndarray]) -> None:
+    if (error := source.exception()) is not None:
+        target.set_exception(error)
+    else:
+        target.set_result(source.result())
+
+
+def grid_clusters(positions: np.ndarray, cell_size: float) -> np.ndarray:
+    """Cluster labels from a spatial hash of the positions into square cells."""
+    cells = np.floor(np.asarray(positions) / cell_size).astype(int)
+    _, labels = np.unique(cells, axis=0, return_inverse=True)
+    return labels.ravel()
+
+
+def _cluster_flows(cost: np.ndarray, supply: np.ndarray, capacity: np.ndarray) -> np.ndarray:
+    n, m = cost.shape
+    edges = np.arange(n * m)
+    a_supply = coo_array((np.ones(n * m), (edges // m, edges)), shape=(n, n * m))
+    a_capacity = coo_array((np.ones(n * m), (edges % m, edges)), shape=(m, n * m))
+    # send as many sources as the targets have room for
+    a_total = np.ones((1, n * m))
+    result = linprog(
+        _finite_cost(cost).ravel(),
+        A_ub=vstack([a_supply, a_capacity]),
+        b_ub=np.concatenate([supply, capacity]),
+        A_eq=a_total,
+        b_eq=[min(supply.sum(), capacity.sum())],
+        method="highs",
+    )
+    if not result.success:
+        raise ValueError(f"Cluster transport failed: {result.message}")
+    # the transport polytope has integral vertices
+    flows = np.rint(result.x).reshape(n, m)
+    # flow forced onto infeasible pairs is dropped, the sources stay unassigned
+    flows[np.isinf(cost)] = 0.0
+    return flows
+
+
+def _reduce_clusters(values: np.ndarray, labels: np.ndarray, ufunc: np.ufunc) -> np.ndarray:
+    """Reduce the columns of values per cluster label."""
+    order = np.argsort(labels, kind="stable")
+    starts = np.searchsorted(labels[order], np.arange(labels.max() + 1))
+    return ufunc.reduceat(values[:, order], starts, axis=1)
+
+
+def solve_clustered(
+    source_positions: np.ndarray,
+    target_positions: np.ndarray,
+    cost: np.ndarray,
+    limit: np.ndarray,
+    cell_size: float,
+    max_cluster_pairs: int = 256,
+) -> np.ndarray:
+    """
+    Hierarchical assignment for large problems.
+    Sources and targets are clustered on a grid, coarsened until there are at most max_cluster_pairs pairs of clusters.
+    Cluster supply is routed to cluster capacity by the cost from each source to the cheapest member of a target
+    cluster, averaged over the sources that can reach it at all.
+    Each source is then placed into one target cluster, and the assignment is solved within every target cluster and
+    the sources routed to it. Sources left over are finally inserted by repair_assignment.
+    """
+    n = len(source_positions)
+    while True:
+        source_labels = grid_clusters(source_positions, cell_size)
+        target_labels = grid_clusters(target_positions, cell_size)
+        if (source_labels.max() + 1) * (target_labels.max() + 1) <= max_cluster_pairs:
+            break
+        cell_size *= 2
+    source_to_cluster = _reduce_clusters(cost, target_labels, np.minimum)
+    reachable = np.isfinite(source_to_cluster)
+    reachable_cost = _reduce_clusters(np.where(reachable, source_to_cluster, 0.0).T, source_labels, np.add).T
+    num_reachable = _reduce_clusters(reachable.T.astype(float), source_labels, np.add).T
+    cluster_cost = np.divide(
+        reachable_cost, num_reachable, where=num_reachable > 0, out=np.full(num_reachable.shape, np.inf)
+    )
+    flows = _cluster_flows(
+        cluster_cost,
+        np.bincount(source_labels).astype(float),
+        np.bincount(target_labels, weights=np.floor(limit)),
+    )
+
+    routed = np.full(n, -1)
+    for k in range(len(flows)):
+        sources = np.flatnonzero(source_labels == k)
+        clusters = np.flatnonzero(flows[k])
+        if not clusters.size:
+            continue
+        problem = AssignmentProblem(source_to_cluster[np.ix_(sources, clusters)], flows[k, clusters])
+        cluster_indices = solve_assignment(problem)
+        routed[sources[cluster_indices >= 0]] = clusters[cluster_indices[cluster_indices >= 0]]
+
+    indices = np.full(n, -1)
+    for j in np.unique(routed[routed >= 0]):
+        sources = np.flatnonzero(routed == j)
+        targets = np.flatnonzero(target_labels == j)
+        problem = AssignmentProblem(cost[np.ix_(sources, targets)], limit[targets])
+        fine_indices = solve_assignment(problem)
+        indices[sources[fine_indices >= 0]] = targets[fine_indices[fine_indices >= 0]]
+
+    # the cluster routing averages over sources and can strand some whose reachable targets are taken elsewhere
+    if (indices < 0).any():
+        indices = repair_assignment(cost, limit, indices)
+    return indices
+
+
+def assignment_excess(cost: np.ndarray, indices: np.ndarray) -> float:
+    """
+    Cost of an assignment above every source taking its cheapest target,
+    relative to the average excess of a random choice. 0 is ideal, 1 is as good as random.
+    """
+    rows = np.flatnonzero(indices >= 0)
+    if not rows.size:
+        return 0.0
+    row_cost = cost[rows]
+    finite = np.isfinite(row_cost)
+    best = np.where(finite, row_cost, np.inf).min(axis=1)
+    typical = np.where(finite, row_cost, 0.0).sum(axis=1) / np.maximum(1, finite.sum(axis=1))
+    spread = (typical - best).sum()
+    excess = (cost[rows, indices[rows]] - best).sum()
+    return float(excess / spread) if spread > 0 else 0.0
+
+
+def repair_assignment(
+    cost: np.ndarray,
+    limit: np.ndarray,
+    previous: np.ndarray,
+) -> np.ndarray:
+    """
+    Locally repair an assignment given by target indices, -1 marking new or orphaned sources.
+    Sources on overfull targets are released, then every open source is inserted greedily,
+    either into the cheapest target with capacity left or by pushing a source out of a full target along a
+    single augmenting step.
+    """
+    n, m = cost.shape
+    indices = previous.copy()
+    indices[(indices >= 0) & np.isinf(cost[np.arange(n), indices])] = -1
+    capacity = np.floor(limit) - np.bincount(indices[indices >= 0], minlength=m)
+
+    # release the most expensive sources on targets whose limit went down
+    for j in np.flatnonzero(capacity < 0):
+        assigned = np.flatnonzero(indices == j)
+        release = assigned[np.argsort(cost[assigned, j])[int(capacity[j]) :]]
+        indices[release] = -1
+        capacity[j] = 0
+
+    open_sources = np.flatnonzero(indices < 0)
+    # insert the sources closest to a target first
+    open_sources = open_sources[
+        np.argsort(np.where(np.isfinite(cost[open_sources]), cost[open_sources], np.inf).min(axis=1))
+    ]
+    for i in open_sources:
+        free = capacity >= 1
+        direct_cost = np.where(free, cost[i], np.inf)
+        j_direct = direct_cost.argmin()
+        best_cost = direct_cost[j_direct]
+        best_move: tuple[int, int, int] | None = None
+
+        j_full = np.where(free, np.inf, cost[i]).argmin()
+        if not free[j_full] and cost[i, j_full] < best_cost and (occupants := np.flatnonzero(indices == j_full)).size:
+            # push one source from the cheapest full target to its best target with capacity
+            alternatives = np.where(free[None, :], cost[occupants], np.inf)
+            k = alternatives.argmin(axis=1)
+            delta = alternatives[np.arange(len(occupants)), k] - cost[occupants, j_full]
+            best = delta.argmin()
+            if cost[i, j_full] + delta[best] < best_cost:
+                best_move = int(occupants[best]), int(j_full), int(k[best])
+
+        if best_move is not None:
+            occupant, j_from, j_to = best_move
+            indices[occupant] = j_to
+            indices[i] = j_from
+            capacity[j_to] -= 1
+        elif np.isfinite(best_cost):
+            indices[i] = j_direct
+            capacity[j_direct] -= 1
+
+    return indices
+
+
+class AssignmentRepair(Generic[TKey, TValue]):
+    """Carry an assignment between frames, repairing it locally until its excess drifts past the last full solve."""
+
+    def __init__(self, drift_threshold: float = 0.1) -> None:
+        self.drift_threshold = drift_threshold
+        self.reference_excess = 0.0
+        self.repair_count = 0
+        self.solve_count = 0
 
-    solver.set_total(np.zeros(m), 0)
-    x = solver.solve(cost, max_assigned)
-    indices = x.argmax(axis=1)
-    assignment = {ai: b[j] for (i, ai), j in zip(enumerate(a), indices, strict=False) if cost[i, j] < np.inf}
+    def update(
+        self,
+        a: Sequence[TKey],
+        b: Sequence[TValue],
+        cost: np.ndarray,
+        max_assigned: np.ndarray,
+        previous: Mapping[TKey, TValue],
+        solve: Callable[[], Mapping[TKey, TValue] | None],
+        is_valid: Callable[[Mapping[TKey, TValue]], bool] | None = None,
+    ) -> Mapping[TKey, TValue] | None:
+        target_index = {bj: j for j, bj in enumerate(b)}
+        if previous and a and b:
+            previous_indices = np.array([target_index.get(previous[ai], -1) if ai in previous else -1 for ai in a])
+            indices = repair_assignment(cost, max_assigned, previous_indices)
+            repaired = {ai: b[j] for ai, j in zip(a, indices, strict=True) if j >= 0}
+            excess = assignment_excess(cost, indices)
+            if excess <= self.reference_excess + self.drift_threshold and (is_valid is None or is_valid(repaired)):
+                self.repair_count += 1
+                return repaired
 
-    return assignment
+        if (assignment := solve()) is not None:
+            indices = np.array([target_index[assignment[ai]] if ai in assignment else -1 for ai in a])
+            self.reference_excess = assignment_excess(cost, indices) if a else 0.0
+            self.solve_count += 1
+        return assignment
@@ -3,6 +3,9 @@ from collections.abc import Hashable, Sequence, Set
 
 import numpy as np
 from scipy.linalg import null_space
+from scipy.sparse import coo_array
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import KDTree
 
 
 def graph_components_naive(adjacency_matrix: np.ndarray) -> Set[Sequence[int]]:
@@ -37,3 +40,13 @@ def graph_components_opt(adjacency_matrix: np.ndarray) -> Set[Sequence[int]]:
 
 def graph_components(adjacency_matrix: np.ndarray) -> Set[Sequence[int]]:
     return graph_components_opt(adjacency_matrix)
+
+
+def distance_components(positions: np.ndarray, distance: float) -> np.ndarray:
+    """Component label of every point, where points at most the distance apart are connected."""
+    positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+    n = len(positions)
+    pairs = KDTree(positions).query_pairs(distance, output_type="ndarray")
+    adjacency = coo_array((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])), shape=(n, n))
+    _, labels = connected_components(adjacency, directed=False)
+    return labels
@@ -0,0 +1,110 @@
+from collections.abc import Callable, Iterable, Mapping, Sequence
+from dataclasses import dataclass
+
+import numpy as np
+from sc2.ids.unit_typeid import UnitTypeId
+from sc2.unit import Unit
+
+from phantom.common.utils import air_dps_of, air_range_of, ground_dps_of, ground_range_of
+
+
+class UnitTypeStats:
+    """
+    Combat stats per unit type with the overrides applied, as arrays indexed by type id.
+    Each type is read once from the first unit seen of it, and the table is reset when an upgrade completes.
+    """
+
+    def __init__(self) -> None:
+        size = max(t.value for t in UnitTypeId) + 1
+        self.known = np.zeros(size, dtype=bool)
+        self.ground_dps = np.zeros(size)
+        self.air_dps = np.zeros(size)
+        self.ground_range = np.zeros(size)
+        self.air_range = np.zeros(size)
+
+    def reset(self) -> None:
+        self.known[:] = False
+
+    def type_indices(self, units: Sequence[Unit]) -> np.ndarray:
+        """Type index of every unit, filling in the types not seen since the last reset."""
+        types = np.array([u.type_id.value for u in units], dtype=int)
+        for i in np.flatnonzero(~self.known[types]).tolist():
+            unit = units[i]
+            t = types[i]
+            if not self.known[t]:
+                self.ground_dps[t] = ground_dps_of(unit)
+                self.air_dps[t] = air_dps_of(unit)
+                self.ground_range[t] = ground_range_of(unit)
+                self.air_range[t] = air_range_of(unit)
+                self.known[t] = True
+        return types
+
+
+@dataclass(frozen=True)
+class UnitTable:
+    """
+    Unit features as contiguous columns, built once per frame.
+    Rows are looked up by tag, consumers take the rows they need instead of reading unit properties again.
+    """
+
+    rows: Mapping[int, int]
+    position: np.ndarray
+    radius: np.ndarray
+    ground_range: np.ndarray
+    air_range: np.ndarray
+    ground_dps: np.ndarray
+    air_dps: np.ndarray
+    speed: np.ndarray
+    hp: np.ndarray
+    flying: np.ndarray
+    attackable: np.ndarray
+    enemy: np.ndarray
+
+    @classmethod
+    def build(cls, units: Iterable[Unit], stats: UnitTypeStats, is_detected: Callable[[Unit], bool]) -> "UnitTable":
+        units = list(units)
+        types = stats.type_indices(units)
+        return UnitTable(
+            rows={u.tag: i for i, u in enumerate(units)},
+            position=np.array([u.position for u in units], dtype=float).reshape(-1, 2),
+            radius=np.array([u.radius for u in units], dtype=float),
+            ground_range=stats.ground_range[types],
+            air_range=stats.air_range[types],
+            ground_dps=stats.ground_dps[types],
+            air_dps=stats.air_dps[types],
+            speed=np.array([u.real_speed for u in units], dtype=float),
+            hp=np.array([u.health + u.shield for u in units], dtype=float),
+            flying=np.array([u.is_flying for u in units], dtype=bool),
+            attackable=np.array(
+                [not (u.is_burrowed or u.is_cloaked) or is_detected(u) for u in units],
+                dtype=bool,
+            ),
+            enemy=np.array([u.is_enemy for u in units], dtype=bool),
+        )
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __contains__(self, unit: Unit) -> bool:
+        return unit.tag in self.rows
+
+    def indices(self, units: Sequence[Unit]) -> np.ndarray:
+        return np.array([self.rows[u.tag] for u in units], dtype=int)
+
+    def take(self, units: Sequence[Unit]) -> "UnitTable":
+        """Table with the rows of the given units, in order."""
+        indices = self.indices(units)
+        return UnitTable(
+            rows={u.tag: i for i, u in enumerate(units)},
+            position=self.position[indices],
+            radius=self.radius[indices],
+            ground_range=self.ground_range[indices],
+            air_range=self.air_range[indices],
+            ground_dps=self.ground_dps[indices],
+            air_dps=self.air_dps[indices],
+            speed=self.speed[indices],
+            hp=self.hp[indices],
+            flying=self.flying[indices],
+            attackable=self.attackable[indices],
+            enemy=self.enemy[indices],
+        )
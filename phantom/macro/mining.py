@@ -1,5 +1,5 @@
 import math
-from collections.abc import Sequence
+from collections.abc import Mapping, Sequence
 from dataclasses import dataclass
 from typing import TYPE_CHECKING
 
@@ -12,7 +12,7 @@ from sc2.unit import Unit
 from sc2.units import Units
 
 from phantom.common.action import Action, Smart
-from phantom.common.distribute import get_assignment_solver
+from phantom.common.distribute import AssignmentProblem, AssignmentRepair, solve_assignment
 from phantom.common.metrics import MetricAccumulator
 from phantom.common.utils import Point, pairwise_distances, to_point
 from phantom.learn.parameters import OptimizationTarget, ParameterManager, Prior
@@ -20,7 +20,7 @@ from phantom.learn.parameters import OptimizationTarget, ParameterManager, Prior
 if TYPE_CHECKING:
     from phantom.main import PhantomBot
 
-type HarvesterAssignment = dict[int, Point]
+type HarvesterAssignment = Mapping[int, Point]
 
 
 @dataclass
@@ -108,6 +108,7 @@ class MiningState:
         self.params = MiningParameters(params)
         self.assignment: HarvesterAssignment = {}
         self.gather_hash = 0
+        self.repair = AssignmentRepair[int, Point](bot.bot_config.assignment_drift_threshold)
         self.efficiency = MetricAccumulator()
 
     def step(self, observation: MiningContext) -> "MiningStep":
@@ -180,16 +181,32 @@ class MiningStep:
         is_gas = np.array([1.0 if r.mineral_contents == 0 else 0.0 for r in resources])
         limit = np.array([max_assigned_mineral if r.is_mineral_field else max_assigned_gas for r in resources])
 
-        problem = get_assignment_solver(n, m)
-        problem.set_total(is_gas, gas_target)
+        resource_positions = [to_point(r.position) for r in resources]
+        gas_positions = {to_point(g.position) for g in self.context.gas_buildings}
 
-        x = problem.solve(cost, limit)
-        indices = x.argmax(axis=1)
-        assignment = {
-            ai.tag: to_point(resources[j].position) for (i, ai), j in zip(enumerate(harvesters), indices, strict=False)
-        }
-
-        return assignment
+        def solve_full() -> HarvesterAssignment:
+            problem = AssignmentProblem(
+                cost=cost,
+                limit=limit,
+                total_coeffs=is_gas,
+                total_limit=gas_target,
+                candidates=self.context.bot.bot_config.assignment_candidates,
+            )
+            indices = solve_assignment(problem)
+            return {h.tag: resource_positions[j] for h, j in zip(harvesters, indices, strict=True) if j >= 0}
+
+        def meets_gas_target(assignment: HarvesterAssignment) -> bool:
+            return sum(p in gas_positions for p in assignment.values()) == gas_target
+
+        return self.state.repair.update(
+            a=[h.tag for h in harvesters],
+            b=resource_positions,
+            cost=cost,
+            max_assigned=limit,
+            previous=self.state.assignment,
+            solve=solve_full,
+            is_valid=meets_gas_target,
+        )
 
     def gather_with(self, unit: Unit, return_targets: Units) -> Action | None:
         if not (target_pos := self.harvester_assignment.get(unit.tag)):
@@ -43,6 +43,7 @@ from phantom.common.constants import (
 from phantom.common.cost import Cost, CostManager
 from phantom.common.damage_tracker import DamageTracker
 from phantom.common.expansion import Expansion
+from phantom.common.unit_table import UnitTable, UnitTypeStats
 from phantom.common.utils import (
     RNG,
     MacroId,
@@ -77,6 +78,7 @@ class PhantomBot(AresBot):
         self.expansions = dict[Point, Expansion]()
         self.structure_dict = dict[Point, Unit | OrderedStructure | MacroPlan]()
         self.damage_tracker = DamageTracker()
+        self.unit_type_stats = UnitTypeStats()
 
         self._setup_logging()
         self._read_version()
@@ -151,6 +153,7 @@ class PhantomBot(AresBot):
 
     async def on_upgrade_complete(self, upgrade: UpgradeId) -> None:
         await super().on_upgrade_complete(upgrade)
+        self.unit_type_stats.reset()
 
     def add_replay_tag(self, replay_tag: str) -> None:
         self._replay_tags_unsent.append(replay_tag)
@@ -499,6 +502,14 @@ class PhantomBot(AresBot):
 
         self.bank = Cost(self.minerals, self.vespene, self.supply_left, self.larva.amount)
 
+    @property_cache_once_per_frame
+    def unit_table(self) -> UnitTable:
+        return UnitTable.build(
+            self.all_units,
+            self.unit_type_stats,
+            lambda u: self.mediator.get_is_detected(unit=u, by_enemy=u.is_mine),
+        )
+
     @property_cache_once_per_frame
     def ground_grid(self) -> np.ndarray:
         grid = self.mediator.get_ground_grid
@@ -1,12 +1,14 @@
-from collections.abc import Mapping, Sequence, Set
+import math
+from collections.abc import Callable, Mapping, Sequence, Set
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from functools import cached_property
+from functools import cached_property, partial
 from typing import TYPE_CHECKING
 
 import numpy as np
-from ares import UnitTreeQueryType
 from cython_extensions import cy_attack_ready, cy_dijkstra
 from cython_extensions.dijkstra import DijkstraPathing
+from loguru import logger
 from sc2.data import Race
 from sc2.ids.unit_typeid import UnitTypeId
 from sc2.position import Point2
@@ -18,21 +20,25 @@ from phantom.common.constants import (
     COMBATANT_STRUCTURES,
     ENEMY_CIVILIANS,
     HALF,
-    MAX_UNIT_RADIUS,
 )
-from phantom.common.distribute import distribute
+from phantom.common.distribute import AssignmentRepair, AssignmentStats, distribute, solve_clustered
 from phantom.common.utils import (
     Point,
-    air_dps_of,
-    air_range_of,
-    ground_dps_of,
     ground_range_of,
     structure_perimeter,
     to_point,
 )
 from phantom.learn.parameters import OptimizationTarget, ParameterManager, Prior
+from phantom.micro.pathing import (
+    FieldCache,
+    FieldScheduler,
+    FlowField,
+    PathField,
+    are_positions_safe,
+    get_waypoints,
+)
 from phantom.micro.simulator import CombatResult, CombatSetup, CombatSimulator
-from phantom.micro.utils import medoid, time_to_attack, time_to_kill
+from phantom.micro.utils import get_shootable_targets, medoid, time_to_attack, time_to_kill
 
 if TYPE_CHECKING:
     from phantom.main import PhantomBot
@@ -68,24 +74,28 @@ class CombatParameters:
         return np.tanh(self._global_engagement_level.value - self.global_engagement_hysteresis)
 
 
+def _no_field() -> None:
+    return None
+
+
 @dataclass(frozen=True)
 class CombatStepContext:
     state: "CombatState"
     combatants: Sequence[Unit]
     enemy_combatants: Sequence[Unit]
     prediction: CombatResult
+    scheduler: FieldScheduler
 
     @cached_property
     def safe_combatants(self) -> Sequence[Unit]:
-        safe_combatants = list[Unit]()
-        for unit in self.combatants:
-            grid = self.state.bot.mediator.get_air_grid if unit.is_flying else self.state.bot.ground_grid
-            if self.state.bot.mediator.is_position_safe(
-                grid=grid,
-                position=unit.position,
-            ):
-                safe_combatants.append(unit)
-        return safe_combatants
+        flying = np.array([unit.is_flying for unit in self.combatants], dtype=bool)
+        positions = np.array([unit.position for unit in self.combatants]).reshape(-1, 2)
+        safe = np.where(
+            flying,
+            are_positions_safe(self.state.bot.mediator.get_air_grid, positions),
+            are_positions_safe(self.state.bot.ground_grid, positions),
+        )
+        return [unit for unit, is_safe in zip(self.combatants, safe.tolist(), strict=True) if is_safe]
 
     @cached_property
     def retreat_to_creep_targets(self) -> Sequence[Point]:
@@ -97,44 +107,24 @@ class CombatStepContext:
         return targets
 
     @cached_property
-    def retreat_to_creep(self) -> DijkstraPathing | None:
-        if self.retreat_to_creep_targets:
-            return cy_dijkstra(self.state.bot.ground_grid, np.atleast_2d(self.retreat_to_creep_targets))
-        else:
-            return None
+    def retreat_to_creep(self) -> PathField | None:
+        return self._field("retreat_to_creep")
+
+    def _safe_positions[T: Sequence[float]](self, positions: Sequence[T]) -> Sequence[T]:
+        safe = are_positions_safe(self.state.bot.ground_grid, np.array(positions))
+        return [p for p, is_safe in zip(positions, safe.tolist(), strict=True) if is_safe]
 
     @cached_property
     def safe_mineral_lines(self) -> Sequence[Point]:
-        return [
-            e.mineral_center
-            for e in self.state.bot.bases_taken.values()
-            if self.state.bot.mediator.is_position_safe(
-                grid=self.state.bot.ground_grid,
-                position=e.mineral_center,
-            )
-        ]
+        return self._safe_positions([e.mineral_center for e in self.state.bot.bases_taken.values()])
 
     @cached_property
     def safe_spine_positions(self) -> Sequence[Point]:
-        return [
-            e.spine_position
-            for e in self.state.bot.bases_taken.values()
-            if self.state.bot.mediator.is_position_safe(
-                grid=self.state.bot.ground_grid,
-                position=e.spine_position,
-            )
-        ]
+        return self._safe_positions([e.spine_position for e in self.state.bot.bases_taken.values()])
 
     @cached_property
     def safe_workers(self) -> Sequence[Point]:
-        return [
-            to_point(w.position)
-            for w in self.state.bot.workers
-            if self.state.bot.mediator.is_position_safe(
-                grid=self.state.bot.ground_grid,
-                position=w.position,
-            )
-        ]
+        return self._safe_positions([to_point(w.position) for w in self.state.bot.workers])
 
     @cached_property
     def retreat_targets(self) -> Sequence[Point]:
@@ -145,38 +135,20 @@ class CombatStepContext:
         return medoid(self.retreat_targets)
 
     @cached_property
-    def retreat_air(self) -> DijkstraPathing | None:
-        if self.retreat_targets:
-            return cy_dijkstra(self.state.bot.mediator.get_air_grid, np.atleast_2d(self.retreat_targets))
-        else:
-            return None
+    def retreat_air(self) -> PathField | None:
+        return self._field("retreat_air")
 
     @cached_property
-    def retreat_ground(self) -> DijkstraPathing | None:
-        if self.retreat_targets:
-            return cy_dijkstra(self.state.bot.ground_grid, np.atleast_2d(self.retreat_targets))
-        else:
-            return None
+    def retreat_ground(self) -> PathField | None:
+        return self._field("retreat_ground")
 
     @cached_property
-    def concentrate_air(self) -> DijkstraPathing | None:
-        if self.retreat_targets:
-            return cy_dijkstra(
-                self.state.bot.mediator.get_air_grid,
-                np.array([to_point(self.concentration_point)]),
-            )
-        else:
-            return None
+    def concentrate_air(self) -> PathField | None:
+        return self._field("concentrate_air")
 
     @cached_property
-    def concentrate_ground(self) -> DijkstraPathing | None:
-        if self.retreat_targets:
-            return cy_dijkstra(
-                self.state.bot.ground_grid,
-                np.array([to_point(self.concentration_point)]),
-            )
-        else:
-            return None
+    def concentrate_ground(self) -> PathField | None:
+        return self._field("concentrate_ground")
 
     @cached_property
     def attack_targets(self) -> Sequence[Point]:
@@ -192,24 +164,47 @@ class CombatStepContext:
         return targets
 
     @cached_property
-    def attack_air(self) -> DijkstraPathing | None:
-        if self.attack_targets:
-            return cy_dijkstra(
-                self.state.bot.mediator.get_air_grid,
-                np.atleast_2d(self.attack_targets),
-            )
-        else:
-            return None
+    def attack_air(self) -> PathField | None:
+        return self._field("attack_air")
 
     @cached_property
-    def attack_ground(self) -> DijkstraPathing | None:
-        if self.attack_targets:
-            return cy_dijkstra(
-                self.state.bot.ground_grid,
-                np.atleast_2d(self.attack_targets),
-            )
+    def attack_ground(self) -> PathField | None:
+        return self._field("attack_ground")
+
+    def schedule_field(self, name: str) -> None:
+        self.scheduler.schedule(name, self._field_task(name))
+
+    def _field(self, name: str) -> PathField | None:
+        if (future := self.scheduler.take(name)) is not None:
+            return future.result()
+        return self._field_task(name)()
+
+    def _field_task(self, name: str) -> Callable[[], PathField | None]:
+        # everything that touches the game state is read here, the task itself only does array work
+        flying = name.endswith("_air")
+        grid = self.state.bot.mediator.get_air_grid if flying else self.state.bot.ground_grid
+        targets: Sequence[Point]
+        # retreat fields are also followed by workers and overlords, only the attack fields are read by combatants alone
+        bounded = False
+        if name == "retreat_to_creep":
+            targets = self.retreat_to_creep_targets
+        elif name.startswith("retreat_"):
+            targets = self.retreat_targets
+        elif name.startswith("concentrate_"):
+            targets = [to_point(self.concentration_point)] if self.retreat_targets else []
+        elif name.startswith("attack_"):
+            targets, bounded = self.attack_targets, True
         else:
-            return None
+            raise KeyError(name)
+        if not targets:
+            return _no_field
+        config = self.state.bot.bot_config
+        if bounded and config.bounded_flow_fields:
+            # with few units, only expand the field as far as the combatants that follow it
+            queries = [to_point(u.position) for u in self.combatants if u.is_flying == flying]
+            if len(queries) <= config.bounded_field_max_units:
+                return partial(FlowField.compute_bounded, grid, np.atleast_2d(targets), np.atleast_2d(queries))
+        return partial(self.state.fields.get, name, grid, targets)
 
     @classmethod
     def build(cls, state: "CombatState") -> "CombatStepContext":
@@ -230,6 +225,7 @@ class CombatStepContext:
             combatants=combatants,
             enemy_combatants=enemy_combatants,
             prediction=prediction,
+            scheduler=FieldScheduler(state.field_executor),
         )
 
 
@@ -240,29 +236,97 @@ class CombatState:
         self._attacking_global = True
         self._attacking_local = set[int]()
         self._targets: Mapping[int, Unit] = dict()
+        self._target_repair = AssignmentRepair[int, Unit](bot.bot_config.assignment_drift_threshold)
+        self.fields: FieldCache[FlowField] | FieldCache[DijkstraPathing] = (
+            FieldCache(FlowField.compute, FlowField.repair)
+            if bot.bot_config.incremental_flow_fields
+            else FieldCache(cy_dijkstra)
+        )
         self.simulator = simulator
+        self.field_executor = (
+            ThreadPoolExecutor(bot.bot_config.pathing_workers, thread_name_prefix="pathing")
+            if bot.bot_config.pathing_workers
+            else None
+        )
+
+    def _schedule_fields(self, context: CombatStepContext) -> None:
+        # start the fields this frame is likely to need, they are built while the targets are being assigned
+        if not self.field_executor:
+            # preparing a task reads its targets from the game state, without an executor fields are built on demand
+            return
+        layers = {u.is_flying for u in context.combatants}
+        for flying, layer in ((True, "air"), (False, "ground")):
+            if flying in layers:
+                context.schedule_field(f"retreat_{layer}")
+                context.schedule_field(f"concentrate_{layer}")
+                if self._attacking_global:
+                    context.schedule_field(f"attack_{layer}")
+        if False in layers:
+            context.schedule_field("retreat_to_creep")
 
     def _assign_targets(self, units: Sequence[Unit], targets: Sequence[Unit]) -> Mapping[int, Unit]:
         if not any(units) or not any(targets):
             return {}
 
-        cost = time_to_attack(self.bot.mediator, units, targets) + time_to_kill(self.bot.mediator, units, targets)
+        tags = [u.tag for u in units]
+        max_assigned = np.full(len(targets), float(math.ceil(len(units) / len(targets))))
+        if len(units) * len(targets) > self.bot.bot_config.targeting_cluster_threshold:
+            return self._assign_targets_clustered(units, targets, max_assigned)
+
+        cost = self._target_cost(units, targets)
+        assignment = self._target_repair.update(
+            a=tags,
+            b=targets,
+            cost=cost,
+            max_assigned=max_assigned,
+            previous=self._targets,
+            solve=lambda: distribute(
+                tags,
+                targets,
+                cost,
+                max_assigned=max_assigned,
+                candidates=self.bot.bot_config.assignment_candidates,
+                stats_hook=self._log_assignment_stats,
+                deadline=self.bot.bot_config.combat_assignment_deadline,
+            ),
+        )
 
+        return assignment or {}
+
+    def _target_cost(self, units: Sequence[Unit], targets: Sequence[Unit]) -> np.ndarray:
+        table = self.bot.unit_table
+        cost = time_to_attack(table, units, targets) + time_to_kill(table, units, targets)
         target_tag_to_index = {t.tag: i for i, t in enumerate(targets)}
         for i, unit in enumerate(units):
             if (previous_target := self._targets.get(unit.tag)) and (j := target_tag_to_index.get(previous_target.tag)):
                 cost[i, j] = 0.0
-
-        assignment = distribute(
-            [u.tag for u in units],
-            targets,
-            cost,
+        return cost
+
+    def _assign_targets_clustered(
+        self, units: Sequence[Unit], targets: Sequence[Unit], max_assigned: np.ndarray
+    ) -> Mapping[int, Unit]:
+        indices = solve_clustered(
+            np.array([u.position for u in units]),
+            np.array([t.position for t in targets]),
+            self._target_cost(units, targets),
+            max_assigned,
+            self.bot.bot_config.targeting_cell_size,
         )
+        return {u.tag: targets[j] for u, j in zip(units, indices, strict=True) if j >= 0}
+
+    def _log_assignment_stats(self, stats: AssignmentStats) -> None:
+        if stats.gap > 0.0:
+            logger.debug(
+                f"Target assignment {stats.n}x{stats.m} solved by {stats.backend} with duality gap {stats.gap:.3f}"
+            )
 
-        return assignment
+    def shutdown(self) -> None:
+        if self.field_executor:
+            self.field_executor.shutdown(wait=False, cancel_futures=True)
 
     def on_step(self) -> "CombatStep":
         context = CombatStepContext.build(self)
+        self._schedule_fields(context)
 
         self._targets = self._assign_targets(context.combatants, context.enemy_combatants)
         targets = {self.bot.unit_tag_dict[tag]: target for tag, target in self._targets.items()}
@@ -294,21 +358,44 @@ class CombatStep:
         self.attacking_global = attacking_global
         self.attacking_local = attacking_local
         self.targets = targets
+        self._waypoints = dict[tuple[str, int], tuple[Mapping[int, int], list[list[int]], list[int]]]()
+        self._safe = dict[tuple[bool, float], Mapping[int, bool]]()
 
     @property
     def confidence_global(self) -> float:
         return self.context.prediction.outcome_global
 
     def retreat_with(self, unit: Unit, smoothing=3) -> Action | None:
-        retreat_map = self.context.retreat_air if unit.is_flying else self.context.retreat_ground
-        if not retreat_map:
+        name = "retreat_air" if unit.is_flying else "retreat_ground"
+        if not (waypoint := self._next_waypoint(name, unit, smoothing)):
             return self.move_to_safe_spot(unit)
-        retreat_path = retreat_map.get_path(unit.position, limit=smoothing)
-        if len(retreat_path) < smoothing:
+        retreat_point, length = waypoint
+        if length < smoothing:
             return None
-        retreat_point = Point2(retreat_path[-1]).offset(HALF)
         return Move(retreat_point)
 
+    def _next_waypoint(self, name: str, unit: Unit, limit: int) -> tuple[Point2, int] | None:
+        """
+        Waypoint and path length from a field.
+        Flow fields are looked up for all units of the field's layer at once, other fields only for the unit asking.
+        """
+        if not (field := getattr(self.context, name)):
+            return None
+        if not isinstance(field, FlowField):
+            path = field.get_path(unit.position, limit=limit)
+            return Point2(path[-1]).offset(HALF), len(path)
+        if (waypoints := self._waypoints.get((name, limit))) is None:
+            flying = name.endswith("_air")
+            units = [u for u in self.bot.units if u.is_flying == flying]
+            unit_cells, unit_lengths = get_waypoints(field, np.array([u.position for u in units]), limit)
+            waypoints = {u.tag: i for i, u in enumerate(units)}, unit_cells.tolist(), unit_lengths.tolist()
+            self._waypoints[name, limit] = waypoints
+        index, cells, lengths = waypoints
+        if (i := index.get(unit.tag)) is None:
+            path = field.get_path(unit.position, limit=limit)
+            return Point2(path[-1]).offset(HALF), len(path)
+        return Point2(cells[i]).offset(HALF), lengths[i]
+
     def move_to_safe_spot(self, unit: Unit) -> Action:
         retreat_grid = self.bot.mediator.get_air_grid if unit.is_flying else self.bot.ground_grid
         retreat_target = self.bot.mediator.find_closest_safe_spot(
@@ -324,18 +411,25 @@ class CombatStep:
         return Move(move_target)
 
     def retreat_to_creep(self, unit: Unit, limit=2) -> Action | None:
-        if not self.bot.has_creep(unit) and self.context.retreat_to_creep:
-            path = self.context.retreat_to_creep.get_path(unit.position, limit=limit)
-            if len(path) == 1:
+        if not self.bot.has_creep(unit) and (waypoint := self._next_waypoint("retreat_to_creep", unit, limit)):
+            target, length = waypoint
+            if length == 1:
                 return None
-            return Move(Point2(path[-1]).offset(HALF))
+            return Move(target)
         return None
 
     def is_unit_safe(self, unit: Unit, weight_safety_limit: float = 1.0) -> bool:
-        grid = self.bot.mediator.get_air_grid if unit.is_flying else self.bot.ground_grid
-        return self.bot.mediator.is_position_safe(
-            grid=grid, position=unit.position, weight_safety_limit=weight_safety_limit
-        )
+        # evaluated for all units of the same layer on first use
+        if (safe := self._safe.get((unit.is_flying, weight_safety_limit))) is None:
+            units = [u for u in self.bot.units if u.is_flying == unit.is_flying]
+            grid = self.bot.mediator.get_air_grid if unit.is_flying else self.bot.ground_grid
+            mask = are_positions_safe(grid, np.array([u.position for u in units]), weight_safety_limit)
+            safe = {u.tag: is_safe for u, is_safe in zip(units, mask.tolist(), strict=True)}
+            self._safe[unit.is_flying, weight_safety_limit] = safe
+        if (is_safe := safe.get(unit.tag)) is None:
+            grid = self.bot.mediator.get_air_grid if unit.is_flying else self.bot.ground_grid
+            return bool(are_positions_safe(grid, np.array([unit.position]), weight_safety_limit)[0])
+        return is_safe
 
     def fight_with(self, unit: Unit) -> Action | None:
         ground_range = ground_range_of(unit)
@@ -361,12 +455,11 @@ class CombatStep:
             return None
 
     def attack_with(self, unit: Unit, smoothing: int = 3) -> Action | None:
-        attack_map = self.context.attack_air if unit.is_flying else self.context.attack_ground
+        name = "attack_air" if unit.is_flying else "attack_ground"
         grid = self.bot.mediator.get_air_grid if unit.is_flying else self.bot.ground_grid
-        if not attack_map:
+        if not (waypoint := self._next_waypoint(name, unit, smoothing)):
             return None
-        path = attack_map.get_path(unit.position, smoothing)
-        target = Point2(path[-1]).offset(HALF)
+        target, _ = waypoint
         if not self.bot.mediator.is_position_safe(grid=grid, position=target):
             return None
         return Attack(target)
@@ -377,49 +470,60 @@ class CombatStep:
         return None
 
     def concentrate(self, unit: Unit, smoothing: int = 3) -> Action | None:
-        concentrate_map = self.context.concentrate_air if unit.is_flying else self.context.concentrate_ground
-        if not concentrate_map:
+        name = "concentrate_air" if unit.is_flying else "concentrate_ground"
+        if not (waypoint := self._next_waypoint(name, unit, smoothing)):
             return None
-        path = concentrate_map.get_path(unit.position, limit=smoothing)
-        if len(path) < smoothing:
+        target, length = waypoint
+        if length < smoothing:
             return None
-        return Move(Point2(path[-1]).offset(HALF))
+        return Move(target)
 
-    def _target_priority(self, unit: Unit, target: Unit) -> float:
-        dps = air_dps_of(target) if unit.is_flying else ground_dps_of(target)
-        already_targeting = 10 * (unit.order_target == target.tag)
-        health = 0.1 * (target.health + target.shield)
-        return (1 + dps) * (1 + already_targeting) / (1 + health)
+    @cached_property
+    def shootable_targets(self) -> Mapping[int, Unit | None]:
+        """Best target in range for every ranged combatant, queried once per frame."""
+        ranged = [u for u in self.context.combatants if ground_range_of(u) > 2]
+        targets = self._best_targets(ranged)
+        return {u.tag: targets.get(u.tag) for u in ranged}
+
+    def _best_targets(self, units: Sequence[Unit]) -> Mapping[int, Unit]:
+        detected = dict[int, bool]()
+
+        def is_detected(target: Unit) -> bool:
+            if (result := detected.get(target.tag)) is None:
+                result = detected[target.tag] = self.bot.mediator.get_is_detected(unit=target, by_enemy=target.is_mine)
+            return result
+
+        table = self.bot.unit_table
+        pairs = [
+            (unit, target)
+            for unit, targets in get_shootable_targets(
+                self.bot.mediator, table, units, require_weapon_ready=False
+            ).items()
+            for target in targets
+            if cy_attack_ready(self.bot, unit, target)
+            and (not (target.is_cloaked or target.is_burrowed) or is_detected(target))
+        ]
+        if not pairs:
+            return {}
 
-    def _shoot_target_in_range(self, unit: Unit) -> Action | None:
-        candidates = list[Unit]()
-
-        def filter_target(target: Unit) -> bool:
-            return (
-                cy_attack_ready(self.bot, unit, target)
-                and unit.target_in_range(target)
-                and (
-                    not (target.is_cloaked or target.is_burrowed)
-                    or self.bot.mediator.get_is_detected(unit=target, by_enemy=target.is_mine)
-                )
-            )
+        unit_rows = table.indices([u for u, _ in pairs])
+        target_rows = table.indices([t for _, t in pairs])
+        dps = np.where(table.flying[unit_rows], table.air_dps[target_rows], table.ground_dps[target_rows])
+        already_targeting = 10.0 * np.array([u.order_target == t.tag for u, t in pairs])
+        health = 0.1 * table.hp[target_rows]
+        priority = (1 + dps) * (1 + already_targeting) / (1 + health)
 
-        if unit.can_attack_ground:
-            (query,) = self.bot.mediator.get_units_in_range(
-                start_points=[unit],
-                distances=[unit.radius + ground_range_of(unit) + MAX_UNIT_RADIUS],
-                query_tree=UnitTreeQueryType.EnemyGround,
-            )
-            candidates.extend(filter(filter_target, query))
-        if unit.can_attack_air:
-            (query,) = self.bot.mediator.get_units_in_range(
-                start_points=[unit],
-                distances=[unit.radius + air_range_of(unit) + MAX_UNIT_RADIUS],
-                query_tree=UnitTreeQueryType.EnemyFlying,
-            )
-            candidates.extend(filter(filter_target, query))
+        # highest priority per unit, ties go to the first candidate
+        owners = np.array([u.tag for u, _ in pairs])
+        order = np.lexsort((-priority, owners))
+        is_best = np.append(True, owners[order][1:] != owners[order][:-1])
+        return {pairs[i][0].tag: pairs[i][1] for i in order[is_best].tolist()}
 
-        if target := max(candidates, key=lambda u: self._target_priority(unit, u), default=None):
+    def _shoot_target_in_range(self, unit: Unit) -> Action | None:
+        if unit.tag in self.shootable_targets:
+            target = self.shootable_targets[unit.tag]
+        else:
+            target = self._best_targets([unit]).get(unit.tag)
+        if target:
             return Attack(target)
-
         return None
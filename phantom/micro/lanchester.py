@@ -0,0 +1,144 @@
+import numpy as np
+
+
+def _first_step(gap: np.ndarray, speed: np.ndarray, times: np.ndarray, can_engage: np.ndarray | bool) -> np.ndarray:
+    """Index of the first time sample at which the gap to close is covered, or len(times) if never."""
+    # ascending times, so counting the samples out of range gives the first one in range
+    out_of_range = gap[None] > speed[None] * times.reshape(-1, *(1,) * gap.ndim)
+    return np.where(can_engage, out_of_range.sum(axis=0, dtype=np.int8), len(times))
+
+
+def _count_started(index: np.ndarray, start: np.ndarray, n: int, num_steps: int) -> np.ndarray:
+    """Number of entries per index that have started by each step, as (steps, n)."""
+    bins = index.ravel() * (num_steps + 1) + start.ravel()
+    counts = np.bincount(bins, minlength=n * (num_steps + 1)).reshape(n, num_steps + 1)
+    return np.cumsum(counts[:, :num_steps], axis=1).T
+
+
+def _scatter(index: np.ndarray, values: np.ndarray, n: int) -> np.ndarray:
+    """Sum of (steps, pairs) values per index, as (steps, n)."""
+    num_steps = len(values)
+    bins = np.arange(num_steps)[:, None] * n + index[None]
+    return np.bincount(bins.ravel(), weights=values.ravel(), minlength=num_steps * n).reshape(num_steps, n)
+
+
+def _spread(num_targets: np.ndarray, dtype: type[np.floating]) -> np.ndarray:
+    # every attacker splits its damage, health and count evenly among the units it engages
+    return np.divide(1, num_targets, where=num_targets != 0, out=np.zeros(num_targets.shape, dtype))
+
+
+def _potential(fire: np.ndarray, forces: np.ndarray, count: np.ndarray, exponent: float) -> np.ndarray:
+    return fire * forces * np.power(np.maximum(fire.dtype.type(1e-10), count), fire.dtype.type(exponent - 2))
+
+
+def lanchester_advantage(
+    dps: np.ndarray,
+    ranges: np.ndarray,
+    distance: np.ndarray,
+    speed: np.ndarray,
+    hp: np.ndarray,
+    times: np.ndarray,
+    exponent: float,
+    n1: int,
+    dtype: type[np.floating] = np.float64,
+) -> np.ndarray:
+    """
+    Mean advantage of every unit over the sampled times, in a generalized Lanchester model.
+    Unit i engages unit j at time t if it deals damage to it and the distance is within range plus i's speed times t.
+    The first n1 units fight the rest, units on the same side never engage each other.
+    Since engagements only start and never end over the ascending times, every pair is reduced to the step it starts
+    at, and all time samples are evaluated in one batch over the blocks between the two sides.
+    """
+    own, enemy = slice(0, n1), slice(n1, None)
+    num_steps = len(times)
+    alive = hp > 0
+    hp = hp.astype(dtype)
+
+    # own units along the rows in both directions
+    dps_own = dps[own, enemy]
+    dps_enemy = dps[enemy, own].T
+    distance = distance[own, enemy].astype(dtype)
+    speed = speed.astype(dtype)
+    times = times.astype(dtype)
+    start_own = _first_step(
+        distance - ranges[own, enemy].astype(dtype), speed[own, None], times, alive[own, None] & (dps_own > 0)
+    )
+    start_enemy = _first_step(
+        distance - ranges[enemy, own].T.astype(dtype), speed[None, enemy], times, alive[None, enemy] & (dps_enemy > 0)
+    )
+    start_engaged = np.minimum(start_own, start_enemy)
+
+    # (steps, own, enemy)
+    steps = np.arange(num_steps)[:, None, None]
+    attacks = (start_own[None] <= steps).astype(dtype)
+    attacked = (start_enemy[None] <= steps).astype(dtype)
+    engaged = (start_engaged[None] <= steps).astype(dtype)
+
+    n2 = start_own.shape[1]
+    rows = np.broadcast_to(np.arange(n1)[:, None], start_own.shape)
+    cols = np.broadcast_to(np.arange(n2)[None, :], start_own.shape)
+    spread_own = _spread(_count_started(rows, start_own, n1, num_steps), dtype)
+    spread_enemy = _spread(_count_started(cols, start_enemy, n2, num_steps), dtype)
+    weights_own = np.stack((spread_own, spread_own * hp[None, own]), axis=1)
+    weights_enemy = np.stack((spread_enemy, spread_enemy * hp[None, enemy]), axis=2)
+
+    count_enemy, forces_enemy = np.matmul(weights_own, attacks).transpose(1, 0, 2)
+    count_own, forces_own = np.matmul(attacked, weights_enemy).transpose(2, 0, 1)
+    fire_enemy = np.matmul(spread_own[:, None, :], attacks * dps_own.astype(dtype))[:, 0]
+    fire_own = np.matmul(attacked * dps_enemy.astype(dtype), spread_enemy[:, :, None])[:, :, 0]
+    potential2_own = _potential(fire_own, forces_own, count_own, exponent)
+    potential2_enemy = _potential(fire_enemy, forces_enemy, count_enemy, exponent)
+
+    num_engaged_own = np.maximum(1, _count_started(rows, start_engaged, n1, num_steps))
+    num_engaged_enemy = np.maximum(1, _count_started(cols, start_engaged, n2, num_steps))
+    potential1_own = np.matmul(engaged, potential2_enemy[:, :, None])[:, :, 0] / num_engaged_own
+    potential1_enemy = np.matmul(potential2_own[:, None, :], engaged)[:, 0] / num_engaged_enemy
+
+    advantage = np.concatenate((potential1_own - potential2_own, potential1_enemy - potential2_enemy), axis=1)
+    return advantage.mean(axis=0)
+
+
+def lanchester_advantage_sparse(
+    attacker: np.ndarray,
+    target: np.ndarray,
+    dps: np.ndarray,
+    gap: np.ndarray,
+    speed: np.ndarray,
+    hp: np.ndarray,
+    times: np.ndarray,
+    exponent: float,
+    dtype: type[np.floating] = np.float64,
+) -> np.ndarray:
+    """
+    Same as lanchester_advantage, on a list of directed (attacker, target) pairs with the distance left to close after
+    range. Pairs that are not listed never engage, so time and memory grow with the number of pairs.
+    """
+    n = len(hp)
+    num_steps = len(times)
+    alive = hp > 0
+    hp = hp.astype(dtype)
+    engages = alive[attacker] & (dps > 0)
+    attacker, target, dps = attacker[engages], target[engages], dps[engages].astype(dtype)
+    start = _first_step(gap[engages].astype(dtype), speed.astype(dtype)[attacker], times.astype(dtype), True)
+
+    # (steps, pairs)
+    active = start[None] <= np.arange(num_steps)[:, None]
+    weight = _spread(_count_started(attacker, start, n, num_steps), dtype)[:, attacker] * active
+    fire = _scatter(target, weight * dps, n).astype(dtype)
+    forces = _scatter(target, weight * hp[attacker], n).astype(dtype)
+    count = _scatter(target, weight, n).astype(dtype)
+    potential2 = _potential(fire, forces, count, exponent)
+
+    # engagements in either direction, starting with whichever direction starts first
+    low, high = np.minimum(attacker, target), np.maximum(attacker, target)
+    order = np.lexsort((start, high, low))
+    low, high, start = low[order], high[order], start[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (low[1:] != low[:-1]) | (high[1:] != high[:-1])
+    low, high, start = low[first], high[first], start[first]
+    active = start[None] <= np.arange(num_steps)[:, None]
+    num_engaged = _count_started(np.concatenate((low, high)), np.concatenate((start, start)), n, num_steps)
+    mixed = _scatter(low, potential2[:, high] * active, n) + _scatter(high, potential2[:, low] * active, n)
+    potential1 = mixed / np.maximum(1, num_engaged)
+
+    return (potential1 - potential2).mean(axis=0)
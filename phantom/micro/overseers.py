@@ -1,4 +1,5 @@
 from collections.abc import Mapping, Sequence
+from concurrent.futures import Future
 from dataclasses import dataclass
 from typing import TYPE_CHECKING
 
@@ -8,7 +9,7 @@ from sc2.position import Point2
 from sc2.unit import Unit
 
 from phantom.common.action import Action, Move, UseAbility
-from phantom.common.distribute import distribute
+from phantom.common.distribute import AssignmentSession, completed_future
 from phantom.common.utils import pairwise_distances
 from phantom.micro.combat import CombatStep
 
@@ -39,27 +40,22 @@ class Overseers:
             return 0.1
         return 1
 
-    def get_actions(
+    def assign_targets(
         self,
+        session: AssignmentSession,
         overseers: Sequence[Unit],
         scout_targets: Sequence[Unit],
         detection_targets: Sequence[Point2],
-        combat: CombatStep,
-    ) -> Mapping[Unit, Action]:
-        detection_assignment = (
-            distribute(
+    ) -> tuple[Future[Mapping[Point2, Unit]], Future[Mapping[Unit, Unit]]]:
+        detection_assignment: Future[Mapping[Point2, Unit]] = completed_future({})
+        if detection_targets and overseers:
+            detection_cost = pairwise_distances(
                 detection_targets,
-                overseers,
-                pairwise_distances(
-                    detection_targets,
-                    [u.position for u in overseers],
-                ),
-                max_assigned=1,
+                [u.position for u in overseers],
             )
-            if detection_targets and overseers
-            else {}
-        )
-        detection_assignment_inverse = {u: Point2(p) for p, u in detection_assignment.items()}
+            detection_assignment = session.submit(detection_targets, overseers, detection_cost, max_assigned=1)
+
+        scout_assignment: Future[Mapping[Unit, Unit]] = completed_future({})
 
         if overseers and scout_targets:
             distance = pairwise_distances(
@@ -74,9 +70,18 @@ class Overseers:
 
             target_costs = np.array(list(map(self.target_cost, scout_targets)))
             scout_cost = scout_cost * target_costs[None, :]
-            scout_assignment = distribute(overseers, scout_targets, scout_cost)
-        else:
-            scout_assignment = {}
+            scout_assignment = session.submit(overseers, scout_targets, scout_cost)
+
+        return detection_assignment, scout_assignment
+
+    def get_actions(
+        self,
+        overseers: Sequence[Unit],
+        detection_assignment: Mapping[Point2, Unit],
+        scout_assignment: Mapping[Unit, Unit],
+        combat: CombatStep,
+    ) -> Mapping[Unit, Action]:
+        detection_assignment_inverse = {u: Point2(p) for p, u in detection_assignment.items()}
 
         actions = {
             overseer: action
@@ -0,0 +1,385 @@
+import heapq
+import threading
+from collections.abc import Callable, Sequence
+from concurrent.futures import Executor, Future
+from typing import Generic, Protocol, TypeVar
+
+import numpy as np
+from scipy.ndimage import binary_dilation, label
+from scipy.sparse import csr_array
+from scipy.sparse.csgraph import dijkstra
+
+from phantom.common.cache import LRUCache
+
+type FieldKey = tuple[str, int, bytes]
+
+
+class PathField(Protocol):
+    def get_path(self, start: tuple[float, float], limit: int = 0) -> Sequence[tuple[int, int]]: ...
+
+
+TField = TypeVar("TField", bound=PathField)
+
+
+class FieldCache(Generic[TField]):
+    """
+    Distance fields kept across frames.
+    A field is reused as long as its grid revision and the exact set of target cells stay the same.
+    Otherwise, the latest field of the same name is repaired if possible, or computed from scratch.
+    Repairs that give up and fall back to computing from scratch are counted separately.
+    Fields of different names can be requested from multiple threads at once.
+    """
+
+    def __init__(
+        self,
+        compute: Callable[[np.ndarray, np.ndarray], TField],
+        repair: Callable[[TField, np.ndarray, np.ndarray], TField | None] | None = None,
+        capacity: int = 32,
+    ) -> None:
+        self.compute = compute
+        self.repair = repair
+        self.fields = LRUCache[FieldKey, TField](capacity)
+        self.latest = dict[str, TField]()
+        self.revisions = dict[str, int]()
+        self.repair_count = 0
+        self.fallback_count = 0
+        self._grids = dict[str, np.ndarray]()
+        self._lock = threading.Lock()
+
+    @property
+    def hits(self) -> int:
+        return self.fields.hits
+
+    @property
+    def misses(self) -> int:
+        return self.fields.misses
+
+    def grid_revision(self, name: str, grid: np.ndarray) -> int:
+        previous = self._grids.get(name)
+        if previous is None or previous.shape != grid.shape or not np.array_equal(previous, grid):
+            self._grids[name] = grid.copy()
+            self.revisions[name] = self.revisions.get(name, -1) + 1
+        return self.revisions[name]
+
+    def get(self, name: str, grid: np.ndarray, targets: Sequence[tuple[int, int]] | np.ndarray) -> TField:
+        targets = np.atleast_2d(np.asarray(targets, dtype=np.intp))
+        with self._lock:
+            key = name, self.grid_revision(name, grid), targets.tobytes()
+            field = self.fields.get(key)
+            previous = self.latest.get(name)
+        if field is None:
+            # computed outside the lock so that fields of different names can be built concurrently
+            repaired = self.repair(previous, grid, targets) if self.repair and previous is not None else None
+            field = repaired if repaired is not None else self.compute(grid, targets)
+            with self._lock:
+                self.repair_count += repaired is not None
+                self.fallback_count += self.repair is not None and previous is not None and repaired is None
+                self.fields.put(key, field)
+        with self._lock:
+            self.latest[name] = field
+        return field
+
+
+class FieldScheduler:
+    """
+    Computes fields ahead of time on an executor, so that independent fields are built concurrently and consumers only
+    block on the field they need. Without an executor, nothing is scheduled and fields are built on demand.
+    """
+
+    def __init__(self, executor: Executor | None = None) -> None:
+        self.executor = executor
+        self._pending = dict[str, Future[PathField | None]]()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._pending
+
+    def schedule(self, name: str, compute: Callable[[], PathField | None]) -> None:
+        if self.executor and name not in self._pending:
+            self._pending[name] = self.executor.submit(compute)
+
+    def take(self, name: str) -> Future[PathField | None] | None:
+        return self._pending.pop(name, None)
+
+
+OFFSETS = np.array([(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)])
+STEP_LENGTHS = np.linalg.norm(OFFSETS, axis=1)
+
+
+def _shifted(passable: np.ndarray, dx: int, dy: int) -> tuple[np.ndarray, np.ndarray]:
+    """Flat indices of all cell pairs (u, u + (dx, dy)) with u passable and both inside the grid."""
+    w, h = passable.shape
+    xs, ys = np.nonzero(passable[max(0, -dx) : w - max(0, dx), max(0, -dy) : h - max(0, dy)])
+    xs += max(0, -dx)
+    ys += max(0, -dy)
+    return xs * h + ys, (xs + dx) * h + ys + dy
+
+
+class FlowField:
+    """
+    Distance field on an 8-connected grid, where stepping off a cell costs its weight times the step length.
+    Cells with infinite or nonpositive weight are walls. Fields can be repaired after small changes to the grid or
+    targets instead of recomputing them, the number of cells visited is reported in `touched`.
+    """
+
+    def __init__(self, grid: np.ndarray, targets: np.ndarray, distance: np.ndarray, forward: np.ndarray) -> None:
+        self.grid = grid
+        self.targets = np.array(targets)
+        self.distance = distance
+        self.forward = forward
+        self.touched = distance.size
+
+    @classmethod
+    def compute(cls, grid: np.ndarray, targets: np.ndarray) -> "FlowField":
+        grid = np.array(grid, dtype=float)
+        distance, forward = cls._dijkstra(grid, cls._target_cells(grid.shape, targets))
+        return FlowField(grid, targets, distance, forward)
+
+    @classmethod
+    def compute_bounded(
+        cls, grid: np.ndarray, targets: np.ndarray, queries: np.ndarray, limit: float = np.inf
+    ) -> "FlowField":
+        """
+        Expand only until every query cell is settled or the distance limit is reached.
+        The search is confined to a window around the targets that is grown along with the distance cap, so the
+        cost scales with the area between targets and queries rather than the whole grid.
+        Cells outside the settled region are left unreachable. Queries that no target connects to are ignored.
+        """
+        grid = np.array(grid, dtype=float)
+        w, h = grid.shape
+        target_cells = cls._target_cells(grid.shape, targets)
+        passable = np.isfinite(grid) & (grid > 0)
+        distance = np.full(grid.shape, np.inf)
+        forward = np.full(grid.shape, -1)
+        queries = np.asarray(queries, dtype=int).reshape(-1, 2)
+        queries = queries[(queries >= 0).all(axis=1) & (queries < grid.shape).all(axis=1)]
+        if not target_cells.size or not passable.any():
+            return FlowField(grid, targets, distance, forward)
+        # queries on walls or cut off from every target are never settled and would grow the cap to the whole grid
+        components, _ = label(passable, structure=np.ones((3, 3)))
+        seeds = np.zeros(grid.shape, dtype=bool)
+        seeds.flat[target_cells] = True
+        connected = np.unique(components[binary_dilation(seeds, np.ones((3, 3))) & passable])
+        queries = queries[np.isin(components[queries[:, 0], queries[:, 1]], connected)]
+
+        tx, ty = np.unravel_index(target_cells, grid.shape)
+        min_weight = grid[passable].min()
+        mean_weight = grid[passable].mean()
+        if queries.size:
+            # estimate the distance to the furthest query from the octile distance to its nearest target
+            dx = np.abs(queries[:, 0, None] - tx[None])
+            dy = np.abs(queries[:, 1, None] - ty[None])
+            octile = np.maximum(dx, dy) + (np.sqrt(2) - 1) * np.minimum(dx, dy)
+            cap = min(limit, mean_weight * (1.25 * octile.min(axis=1).max() + 4))
+        else:
+            cap = min(limit, 4 * mean_weight)
+
+        while True:
+            # paths within the cap cannot leave this window
+            reach = int(np.ceil(cap / min_weight)) if np.isfinite(cap) else max(w, h)
+            x0, x1 = max(0, tx.min() - reach), min(w, tx.max() + reach + 1)
+            y0, y1 = max(0, ty.min() - reach), min(h, ty.max() + reach + 1)
+            window = grid[x0:x1, y0:y1]
+            window_targets = (tx - x0) * (y1 - y0) + ty - y0
+            window_distance, window_forward = cls._dijkstra(window, window_targets, cap)
+            is_full = (x1 - x0, y1 - y0) == grid.shape
+            inside = (x0 <= queries[:, 0]) & (queries[:, 0] < x1) & (y0 <= queries[:, 1]) & (queries[:, 1] < y1)
+            settled = inside.all() and np.isfinite(window_distance[queries[:, 0] - x0, queries[:, 1] - y0]).all()
+            if settled or cap >= limit or (is_full and not np.isfinite(cap)):
+                break
+            cap = np.inf if is_full else min(limit, 2 * cap)
+
+        distance[x0:x1, y0:y1] = window_distance
+        fx, fy = np.divmod(window_forward, y1 - y0)
+        forward[x0:x1, y0:y1] = np.where(window_forward < 0, -1, (fx + x0) * h + fy + y0)
+        field = FlowField(grid, targets, distance, forward)
+        field.touched = int(np.isfinite(window_distance).sum())
+        return field
+
+    @staticmethod
+    def _dijkstra(grid: np.ndarray, target_cells: np.ndarray, limit: float = np.inf) -> tuple[np.ndarray, np.ndarray]:
+        w, h = grid.shape
+        passable = np.isfinite(grid) & (grid > 0)
+        rows, columns, weights = [], [], []
+        for (dx, dy), length in zip(OFFSETS, STEP_LENGTHS, strict=True):
+            u, v = _shifted(passable, dx, dy)
+            # the search runs backwards from the targets, along edges v -> u
+            rows.append(v)
+            columns.append(u)
+            weights.append(grid.flat[u] * length)
+        graph = csr_array(
+            (np.concatenate(weights), (np.concatenate(rows), np.concatenate(columns))),
+            shape=(w * h, w * h),
+        )
+        distance, predecessors, _ = dijkstra(
+            graph, indices=target_cells, limit=limit, min_only=True, return_predecessors=True
+        )
+        forward = np.where(predecessors < 0, -1, predecessors)
+        return distance.reshape(grid.shape), forward.reshape(grid.shape)
+
+    @staticmethod
+    def _target_cells(shape: tuple[int, ...], targets: np.ndarray) -> np.ndarray:
+        targets = np.atleast_2d(targets)
+        inside = (targets >= 0).all(axis=1) & (targets < shape).all(axis=1)
+        return np.unique(np.ravel_multi_index(tuple(targets[inside].T), shape))
+
+    def get_path(self, start: tuple[float, float], limit: int = 0) -> list[tuple[int, int]]:
+        x, y = int(start[0]), int(start[1])
+        path = [(x, y)]
+        w, h = self.grid.shape
+        if not (0 <= x < w and 0 <= y < h):
+            return path
+        cell = x * h + y
+        while (limit <= 0 or len(path) < limit) and (cell := int(self.forward.flat[cell])) >= 0:
+            path.append(divmod(cell, h))
+        return path
+
+    def get_waypoints(self, starts: np.ndarray, limit: int) -> tuple[np.ndarray, np.ndarray]:
+        """Last cell and length of get_path(start, limit) for every start, following all paths at once."""
+        starts = np.asarray(starts, dtype=float).reshape(-1, 2).astype(int)
+        w, h = self.grid.shape
+        inside = (starts >= 0).all(axis=1) & (starts < (w, h)).all(axis=1)
+        active = inside.copy()
+        cells = np.where(inside, starts[:, 0] * h + starts[:, 1], 0)
+        lengths = np.ones(len(starts), dtype=int)
+        forward = self.forward.ravel()
+        for _ in range(limit - 1 if limit > 0 else forward.size):
+            following = forward[cells]
+            active &= following >= 0
+            if not active.any():
+                break
+            cells = np.where(active, following, cells)
+            lengths += active
+        waypoints = np.where(inside[:, None], np.stack(np.divmod(cells, h), axis=1), starts)
+        return waypoints, lengths
+
+    def repair(self, grid: np.ndarray, targets: np.ndarray, max_fraction: float = 0.05) -> "FlowField | None":
+        """
+        Return the field for the new grid and targets, derived from this one.
+        Cells whose shortest path got longer are invalidated with their subtree and reseeded from the valid
+        boundary, then shorter paths are propagated Dijkstra-style from the seeds.
+        Returns None if more than max_fraction of the grid would be invalidated, computing from scratch is faster then.
+        """
+        grid = np.array(grid, dtype=float)
+        if grid.shape != self.grid.shape:
+            return None
+        w, h = grid.shape
+        old_targets = set(self._target_cells(grid.shape, self.targets).tolist())
+        new_targets = set(self._target_cells(grid.shape, targets).tolist())
+        changed = np.flatnonzero((grid != self.grid).ravel() & ~(np.isnan(grid) & np.isnan(self.grid)).ravel())
+        new_weight = np.where(np.isfinite(grid) & (grid > 0), grid, np.inf).ravel()
+        old_weight = np.where(np.isfinite(self.grid) & (self.grid > 0), self.grid, np.inf).ravel()
+
+        # invalidate everything that routes through a cell that got more expensive or a removed target
+        forward = self.forward.ravel()
+        roots = [*changed[new_weight[changed] > old_weight[changed]], *(old_targets - new_targets)]
+        invalid = self._subtree(forward, roots, int(max_fraction * grid.size))
+        if invalid is None:
+            return None
+        distance = self.distance.ravel().copy()
+        forward = forward.copy()
+        distance[invalid] = np.inf
+        forward[invalid] = -1
+        reseed = [*invalid, *changed[new_weight[changed] < old_weight[changed]].tolist()]
+
+        # work on a grid padded with walls so that neighbours need no bounds checks
+        hp = h + 2
+
+        def pad(cell: int) -> int:
+            return (cell // h + 1) * hp + cell % h + 1
+
+        # memoryviews give fast scalar access without converting the whole grid
+        weight_padded = np.pad(new_weight.reshape(w, h), 1, constant_values=np.inf).ravel()
+        distance_padded = np.pad(distance.reshape(w, h), 1, constant_values=np.inf).ravel()
+        forward_padded = np.where(forward < 0, -1, (forward // h + 1) * hp + forward % h + 1)
+        forward_padded = np.pad(forward_padded.reshape(w, h), 1, constant_values=-1).ravel().astype(np.int64)
+        weights: memoryview[float] = memoryview(weight_padded)
+        distances: memoryview[float] = memoryview(distance_padded)
+        forwards = memoryview(forward_padded)
+        steps = [
+            (int(dx) * hp + int(dy), float(length)) for (dx, dy), length in zip(OFFSETS, STEP_LENGTHS, strict=True)
+        ]
+        padded_targets = {pad(cell) for cell in new_targets}
+
+        queue = list[tuple[float, int]]()
+        for cell in padded_targets:
+            distances[cell] = 0.0
+            forwards[cell] = -1
+            queue.append((0.0, cell))
+        # reseed invalidated and cheaper cells from their neighbours
+        for cell in map(pad, reseed):
+            if cell in padded_targets or weights[cell] == np.inf:
+                continue
+            for step, length in steps:
+                candidate = distances[cell + step] + weights[cell] * length
+                if candidate < distances[cell]:
+                    distances[cell] = candidate
+                    forwards[cell] = cell + step
+            if distances[cell] < np.inf:
+                queue.append((distances[cell], cell))
+
+        heapq.heapify(queue)
+        touched = set(map(pad, invalid))
+        while queue:
+            d, cell = heapq.heappop(queue)
+            if d > distances[cell]:
+                continue
+            touched.add(cell)
+            for step, length in steps:
+                neighbour = cell + step
+                candidate = d + weights[neighbour] * length
+                if candidate < distances[neighbour]:
+                    distances[neighbour] = candidate
+                    forwards[neighbour] = cell
+                    heapq.heappush(queue, (candidate, neighbour))
+
+        distance = distance_padded.reshape(w + 2, hp)[1:-1, 1:-1].copy()
+        forward_padded = forward_padded.reshape(w + 2, hp)[1:-1, 1:-1]
+        forward = np.where(forward_padded < 0, -1, (forward_padded // hp - 1) * h + forward_padded % hp - 1)
+        field = FlowField(grid, targets, distance, forward)
+        field.touched = len(touched)
+        return field
+
+    @staticmethod
+    def _subtree(forward: np.ndarray, roots: Sequence[int], limit: int) -> list[int] | None:
+        """Cells that route through any of the roots, or None as soon as there are more than limit."""
+        if not roots:
+            return []
+        parents = forward[forward >= 0]
+        children = np.flatnonzero(forward >= 0)[np.argsort(parents, kind="stable")]
+        starts = np.concatenate(([0], np.cumsum(np.bincount(parents, minlength=forward.size))))
+        subtree = list(dict.fromkeys(int(r) for r in roots))
+        visited = set(subtree)
+        i = 0
+        while i < len(subtree):
+            cell = subtree[i]
+            for child in children[starts[cell] : starts[cell + 1]].tolist():
+                if child not in visited:
+                    visited.add(child)
+                    subtree.append(child)
+            if len(subtree) > limit:
+                return None
+            i += 1
+        return subtree
+
+
+def get_waypoints(field: PathField, starts: np.ndarray, limit: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Batched get_path, returns the last cell and the length of the path for every start.
+    Only flow fields follow all paths at once, other fields are walked one start at a time.
+    """
+    if isinstance(field, FlowField):
+        return field.get_waypoints(starts, limit)
+    paths = [field.get_path((x, y), limit) for x, y in np.asarray(starts).reshape(-1, 2).tolist()]
+    waypoints = np.array([path[-1] for path in paths], dtype=int).reshape(-1, 2)
+    return waypoints, np.array([len(path) for path in paths], dtype=int)
+
+
+def are_positions_safe(grid: np.ndarray, positions: np.ndarray, weight_safety_limit: float = 1.0) -> np.ndarray:
+    """
+    Vectorised is_position_safe, a position is safe if its cell weight is within the limit or the cell is unpathable.
+    Positions outside the grid are clamped to the border.
+    """
+    cells = np.asarray(positions, dtype=float).reshape(-1, 2).astype(int)
+    cells = np.clip(cells, 0, np.subtract(grid.shape, 1))
+    weights = grid[cells[:, 0], cells[:, 1]]
+    return (weights <= weight_safety_limit) | np.isposinf(weights)
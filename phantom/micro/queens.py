@@ -1,4 +1,5 @@
-from collections.abc import Sequence
+from collections.abc import Mapping, Sequence
+from concurrent.futures import Future
 from typing import TYPE_CHECKING
 
 from cython_extensions import cy_distance_to
@@ -7,7 +8,7 @@ from sc2.unit import Unit
 
 from phantom.common.action import Action, Move, UseAbility
 from phantom.common.constants import ENERGY_GENERATION_RATE
-from phantom.common.distribute import distribute
+from phantom.common.distribute import AssignmentSession, completed_future
 from phantom.common.utils import pairwise_distances
 from phantom.micro.combat import CombatStep
 from phantom.micro.creep import CreepSpread
@@ -22,22 +23,24 @@ class Queens:
         self.bot = bot
         self.transfuse = Transfuse(bot)
 
+    def assign_injects(
+        self, session: AssignmentSession, queens: Sequence[Unit], inject_targets: Sequence[Unit]
+    ) -> Future[Mapping[Unit, Unit]]:
+        if not queens or not inject_targets:
+            return completed_future({})
+        cost = pairwise_distances(
+            [b.position for b in inject_targets],
+            [a.position for a in queens],
+        )
+        return session.submit(inject_targets, queens, cost, max_assigned=1)
+
     def get_actions(
-        self, queens: Sequence[Unit], inject_targets: Sequence[Unit], creep: CreepSpread | None, combat: CombatStep
+        self,
+        queens: Sequence[Unit],
+        inject_assignment: Mapping[Unit, Unit],
+        creep: CreepSpread | None,
+        combat: CombatStep,
     ) -> dict[Unit, Action]:
-        inject_assignment = (
-            distribute(
-                inject_targets,
-                queens,
-                pairwise_distances(
-                    [b.position for b in inject_targets],
-                    [a.position for a in queens],
-                ),
-                max_assigned=1,
-            )
-            if queens and inject_targets
-            else {}
-        )
         inject_assignment_inverse = {q: h for h, q in inject_assignment.items()}
         actions = {
             queen: action
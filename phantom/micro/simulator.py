@@ -1,26 +1,49 @@
-from collections.abc import Mapping, Sequence, Set
+import lzma
+import pickle
+from collections import Counter
+from collections.abc import Iterable, Mapping, Sequence, Set
 from dataclasses import dataclass
 from typing import TYPE_CHECKING
 
 import numpy as np
-from sc2.ids.unit_typeid import UnitTypeId
+from loguru import logger
 from sc2.unit import Unit
 from sc2_helper.combat_simulator import CombatSimulator as SC2CombatSimulator
+from scipy.spatial import KDTree
 from scipy.special import expit
 from scipy.stats import expon
 
-from phantom.common.utils import (
-    air_dps_of,
-    air_range_of,
-    ground_dps_of,
-    ground_range_of,
-    pairwise_distances,
-)
+from phantom.common.cache import LRUCache
+from phantom.common.graph import distance_components
+from phantom.common.unit_table import UnitTable
+from phantom.common.utils import pairwise_distances
 from phantom.learn.parameters import OptimizationTarget, ParameterManager, Prior
+from phantom.micro.lanchester import lanchester_advantage, lanchester_advantage_sparse
+from phantom.micro.surrogate import ArmyStats, CombatSurrogate
 
 if TYPE_CHECKING:
     from phantom.main import PhantomBot
 
+type ArmyFingerprint = tuple[tuple[tuple[int, int, int, int, int], int], ...]
+
+
+def army_fingerprint(units: Iterable[Unit], hp_buckets: int) -> ArmyFingerprint:
+    """Count of units per type, upgrade levels and quantised health, independent of order and position."""
+    return tuple(
+        sorted(
+            Counter(
+                (
+                    u.type_id.value,
+                    u.attack_upgrade_level,
+                    u.armor_upgrade_level,
+                    u.shield_upgrade_level,
+                    round(hp_buckets * (u.health + u.shield) / max(1.0, u.health_max + u.shield_max)),
+                )
+                for u in units
+            ).items()
+        )
+    )
+
 
 @dataclass
 class CombatSetup:
@@ -29,10 +52,29 @@ class CombatSetup:
     attacking: Set[int]
 
 
+@dataclass
+class Engagement:
+    tags: Set[int]
+    outcome: float
+
+
 @dataclass
 class CombatResult:
     outcome_global: float
     outcome_local: Mapping[int, float]
+    engagements: Sequence[Engagement] = ()
+
+
+def _army_stats(table: UnitTable, mask: np.ndarray) -> ArmyStats:
+    return ArmyStats(
+        hp=table.hp[mask],
+        ground_dps=table.ground_dps[mask],
+        air_dps=table.air_dps[mask],
+        ground_range=table.ground_range[mask],
+        air_range=table.air_range[mask],
+        speed=table.speed[mask],
+        flying=table.flying[mask],
+    )
 
 
 class CombatSimulatorParameters:
@@ -67,11 +109,21 @@ class CombatSimulator:
         self.num_steps = 10
         self.combat_sim = SC2CombatSimulator()
         self.combat_sim.enable_timing_adjustment(True)
-
-    def is_attackable(self, u: Unit) -> bool:
-        if u.is_burrowed or u.is_cloaked:
-            return self.bot.mediator.get_is_detected(unit=u, by_enemy=u.is_mine)
-        return True
+        self.engage_cache = LRUCache[tuple[ArmyFingerprint, ArmyFingerprint], tuple[bool, float]](
+            bot.bot_config.engage_cache_size, ttl=bot.bot_config.engage_cache_ttl, clock=lambda: self.bot.time
+        )
+        self.surrogate: CombatSurrogate | None = None
+        if bot.bot_config.combat_outcome_backend == "surrogate":
+            self.surrogate = self._load_surrogate(bot.bot_config.combat_surrogate_path)
+
+    @staticmethod
+    def _load_surrogate(path: str) -> CombatSurrogate | None:
+        try:
+            with lzma.open(path, "rb") as f:
+                return pickle.load(f)
+        except Exception as error:
+            logger.warning(f"{error=} while loading {path}, falling back to sc2_helper")
+            return None
 
     def _simulate_trivial(self, setup: CombatSetup) -> CombatResult | None:
         if not any(setup.units1) and not any(setup.units2):
@@ -88,25 +140,79 @@ class CombatSimulator:
 
         units = [*setup.units1, *setup.units2]
         n1 = len(setup.units1)
+        table = self.bot.unit_table.take(units)
+        attacking = np.array([u.tag in setup.attacking for u in units])
+
+        outcome_vector, engagements = self._simulate_local(units, table, n1, attacking)
+        outcome_global = self._outcome_global(setup, table, n1)
 
-        def total_cost(t: UnitTypeId) -> float:
-            cost = self.bot.cost.of(t)
-            total_cost = (cost.minerals + 2 * cost.vespene) * (0.5 if t == UnitTypeId.ZERGLING else 1.0)
-            return total_cost
-
-        ground_range = np.array([ground_range_of(u) for u in units])
-        air_range = np.array([air_range_of(u) for u in units])
-        ground_dps = np.array([ground_dps_of(u) for u in units])
-        air_dps = np.array([air_dps_of(u) for u in units])
-        radius = np.array([u.radius for u in units])
-        attackable = np.array([self.is_attackable(u) for u in units])
-        flying = np.array([u.is_flying for u in units])
-        bonus_range = np.array([self.parameters.enemy_range_bonus if u.is_enemy else 0.0 for u in units])
-
-        ground_selector = np.where(attackable & ~flying, 1.0, 0.0)
-        air_selector = np.where(attackable & flying, 1.0, 0.0)
-        dps = np.outer(ground_dps, ground_selector) + np.outer(air_dps, air_selector)
-        ranges = np.outer(ground_range, ground_selector) + np.outer(air_range, air_selector)
+        outcome_local = {u.tag: o for u, o in zip(units, outcome_vector.tolist(), strict=True)}
+        result = CombatResult(outcome_local=outcome_local, outcome_global=outcome_global, engagements=engagements)
+        return result
+
+    def _simulate_local(
+        self, units: Sequence[Unit], table: UnitTable, n1: int, attacking: np.ndarray
+    ) -> tuple[np.ndarray, Sequence[Engagement]]:
+        q = np.linspace(start=0.0, stop=1.0, num=self.num_steps, endpoint=False)
+        dist = expon(scale=self.parameters.time_distribution_lambda)
+        times = dist.ppf(q)
+
+        # units further apart than anyone can reach within the simulated time do not interact
+        reach = (
+            np.maximum(table.ground_range, table.air_range).max()
+            + self.parameters.enemy_range_bonus
+            + 2 * table.radius.max()
+            + 1.4 * table.speed[attacking].max(initial=0.0) * times.max()
+        )
+        labels = distance_components(table.position, reach + 1e-6)
+
+        outcome_vector = np.zeros(len(units))
+        engagements = list[Engagement]()
+        for label in range(labels.max() + 1):
+            members = np.flatnonzero(labels == label)
+            own = members < n1
+            if own.all() or not own.any():
+                continue
+            engagement_units = [units[i] for i in members.tolist()]
+            outcome_vector[members] = self._simulate_engagement(
+                table.take(engagement_units), int(own.sum()), attacking[members], times, reach
+            )
+            engagements.append(
+                Engagement(tags={u.tag for u in engagement_units}, outcome=float(outcome_vector[members[own]].mean()))
+            )
+        return outcome_vector, engagements
+
+    def _outcome_global(self, setup: CombatSetup, table: UnitTable, n1: int) -> float:
+        if self.surrogate:
+            own = np.arange(len(table)) < n1
+            return self.surrogate.predict_engage(_army_stats(table, own), _army_stats(table, ~own))
+        health1 = max(1, table.hp[:n1].sum())
+        health2 = max(1, table.hp[n1:].sum())
+        win, health_result = self._predict_engage(setup)
+        return health_result / health1 if win else -health_result / health2
+
+    def _predict_engage(self, setup: CombatSetup) -> tuple[bool, float]:
+        """Global prediction from sc2_helper, reused while both armies keep the same fingerprint."""
+        hp_buckets = self.bot.bot_config.engage_cache_hp_buckets
+        key = army_fingerprint(setup.units1, hp_buckets), army_fingerprint(setup.units2, hp_buckets)
+        if (prediction := self.engage_cache.get(key)) is None:
+            prediction = self.combat_sim.predict_engage(setup.units1, setup.units2, optimistic=True, defender_player=2)
+            self.engage_cache.put(key, prediction)
+        return prediction
+
+    def _simulate_engagement(
+        self, table: UnitTable, n1: int, attacking: np.ndarray, times: np.ndarray, reach: float
+    ) -> np.ndarray:
+        if len(table) > self.bot.bot_config.sparse_simulation_threshold:
+            return self._simulate_engagement_sparse(table, n1, attacking, times, reach)
+
+        radius = table.radius
+        bonus_range = np.where(table.enemy, self.parameters.enemy_range_bonus, 0.0)
+
+        ground_selector = np.where(table.attackable & ~table.flying, 1.0, 0.0)
+        air_selector = np.where(table.attackable & table.flying, 1.0, 0.0)
+        dps = np.outer(table.ground_dps, ground_selector) + np.outer(table.air_dps, air_selector)
+        ranges = np.outer(table.ground_range, ground_selector) + np.outer(table.air_range, air_selector)
         ranges += bonus_range[:, None]
         ranges += radius[:, None]
         ranges += radius[None, :]
@@ -114,62 +220,46 @@ class CombatSimulator:
         dps[:n1, :n1] = 0.0
         dps[n1:, n1:] = 0.0
 
-        distance = pairwise_distances([u.position for u in units])
-        movement_speed_vector = np.array([1.4 * u.real_speed if u.tag in setup.attacking else 0.0 for u in units])
-        movement_speed = movement_speed_vector[:, None]
-
-        mix_friendly = np.reciprocal(1 + distance)
-        mix_friendly[:n1, n1:] = 0.0
-        mix_friendly[n1:, :n1] = 0.0
-        mix_friendly_sum = mix_friendly.sum(axis=1, keepdims=True)
-        np.divide(mix_friendly, mix_friendly_sum, where=mix_friendly_sum != 0, out=mix_friendly)
-
-        hp = np.array([u.health + u.shield for u in units])
-        hp.sum() / np.maximum(1e-3, dps.max(1).sum())
+        distance = pairwise_distances(table.position)
+        movement_speed = np.where(attacking, 1.4 * table.speed, 0.0)
 
-        q = np.linspace(start=0.0, stop=1.0, num=self.num_steps, endpoint=False)
-        dist = expon(scale=self.parameters.time_distribution_lambda)
-        times = dist.ppf(q)
+        return lanchester_advantage(
+            dps, ranges, distance, movement_speed, table.hp, times, self.parameters.lancester_dimension, n1, self._dtype
+        )
 
-        lancester1 = np.full((len(units), self.num_steps), 0.0)
-        lancester2 = np.full((len(units), self.num_steps), 0.0)
-        lancester_pow = self.parameters.lancester_dimension
-        for i, ti in enumerate(times):
-            range_projection = ranges + movement_speed * ti
-            alive = hp > 0
-            valid = alive[:, None] & (distance <= range_projection) & (dps > 0)
-
-            offense = np.zeros_like(valid, dtype=float)
-            num_targets = valid.sum(axis=1, keepdims=True)
-            np.divide(valid, num_targets, where=num_targets != 0, out=offense)
-
-            strength = np.where(alive, 1.0, 0.0)
-            fire2 = strength @ (dps * offense)
-            forces2 = hp @ offense
-            count2 = strength @ offense
-            potential2 = fire2 * forces2 * np.power(np.maximum(1e-10, count2), lancester_pow - 2)
-
-            dps.max(1) @ mix_friendly
-            hp @ mix_friendly
-            # potential1 = fire1 * forces1 * np.power(np.maximum(1e-10, count1), lancester_pow - 2)
-
-            valid_sym = valid | valid.T
-            mix = valid_sym / np.maximum(1, valid_sym.sum(0, keepdims=True))
-            potential1 = potential2 @ mix
-
-            lancester1[:, i] = potential1
-            lancester2[:, i] = potential2
-
-        advantage = lancester1 - lancester2
-        outcome_vector = advantage.mean(1)
-
-        health1 = max(1, sum(u.health + u.shield for u in setup.units1))
-        health2 = max(1, sum(u.health + u.shield for u in setup.units2))
-        win, health_result = self.combat_sim.predict_engage(
-            setup.units1, setup.units2, optimistic=True, defender_player=2
+    def _simulate_engagement_sparse(
+        self, table: UnitTable, n1: int, attacking: np.ndarray, times: np.ndarray, reach: float
+    ) -> np.ndarray:
+        """Same as the dense pass, restricted to the pairs of opposing units within reach of each other."""
+        pairs = KDTree(table.position).query_pairs(reach + 1e-6, output_type="ndarray")
+        a, b = pairs[(pairs[:, 0] < n1) != (pairs[:, 1] < n1)].T
+        attacker = np.concatenate((a, b))
+        target = np.concatenate((b, a))
+
+        bonus_range = np.where(table.enemy[attacker], self.parameters.enemy_range_bonus, 0.0)
+        ground_selector = table.attackable[target] & ~table.flying[target]
+        air_selector = table.attackable[target] & table.flying[target]
+        dps = np.where(ground_selector, table.ground_dps[attacker], 0.0)
+        dps += np.where(air_selector, table.air_dps[attacker], 0.0)
+        ranges = np.where(ground_selector, table.ground_range[attacker], 0.0)
+        ranges += np.where(air_selector, table.air_range[attacker], 0.0)
+        ranges += bonus_range + table.radius[attacker] + table.radius[target]
+        gap = np.linalg.norm(table.position[attacker] - table.position[target], axis=1) - ranges
+
+        movement_speed = np.where(attacking, 1.4 * table.speed, 0.0)
+
+        return lanchester_advantage_sparse(
+            attacker,
+            target,
+            dps,
+            gap,
+            movement_speed,
+            table.hp,
+            times,
+            self.parameters.lancester_dimension,
+            self._dtype,
         )
-        outcome_global = health_result / health1 if win else -health_result / health2
 
-        outcome_local = {u.tag: o for u, o in zip(units, outcome_vector, strict=True)}
-        result = CombatResult(outcome_local=outcome_local, outcome_global=outcome_global)
-        return result
+    @property
+    def _dtype(self) -> type[np.floating]:
+        return np.float32 if self.bot.bot_config.combat_simulation_float32 else np.float64
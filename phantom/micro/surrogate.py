@@ -0,0 +1,68 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass(frozen=True)
+class ArmyStats:
+    """Per-unit combat stats of one army, as columns."""
+
+    hp: np.ndarray
+    ground_dps: np.ndarray
+    air_dps: np.ndarray
+    ground_range: np.ndarray
+    air_range: np.ndarray
+    speed: np.ndarray
+    flying: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.hp)
+
+
+def _side_features(army: ArmyStats, enemy: ArmyStats) -> np.ndarray:
+    hp = army.hp.sum()
+    enemy_hp = max(1.0, enemy.hp.sum())
+    # damage against the enemy army, weighted by how much of its health is on the ground and in the air
+    air_share = enemy.hp[enemy.flying].sum() / enemy_hp
+    dps = (1 - air_share) * army.ground_dps.sum() + air_share * army.air_dps.sum()
+    unit_range = np.where(enemy.flying.any(), np.maximum(army.ground_range, army.air_range), army.ground_range)
+    return np.array(
+        [
+            np.log1p(hp),
+            np.log1p(dps),
+            np.log1p(hp * dps),
+            np.log1p(len(army)),
+            unit_range.mean() if len(army) else 0.0,
+            army.speed.mean() if len(army) else 0.0,
+        ]
+    )
+
+
+def combat_features(army1: ArmyStats, army2: ArmyStats) -> np.ndarray:
+    """Pooled features of one fight, antisymmetric in the two armies."""
+    return _side_features(army1, army2) - _side_features(army2, army1)
+
+
+@dataclass(frozen=True)
+class CombatSurrogate:
+    """
+    Linear model of the global combat outcome in [-1, 1], fit to the predictions of the sc2_helper simulator.
+    Without a bias term, swapping the armies flips the sign of the prediction.
+    """
+
+    scale: np.ndarray
+    weights: np.ndarray
+
+    @classmethod
+    def fit(cls, features: np.ndarray, outcomes: np.ndarray, regularization: float = 1e-3) -> "CombatSurrogate":
+        scale = np.maximum(1e-9, np.sqrt(np.mean(np.square(features), axis=0)))
+        x = features / scale
+        y = np.arctanh(np.clip(outcomes, -0.99, 0.99))
+        weights = np.linalg.solve(x.T @ x + regularization * len(x) * np.identity(x.shape[1]), x.T @ y)
+        return CombatSurrogate(scale=scale, weights=weights)
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        return np.tanh((features / self.scale) @ self.weights)
+
+    def predict_engage(self, army1: ArmyStats, army2: ArmyStats) -> float:
+        return float(self.predict(combat_features(army1, army2)))
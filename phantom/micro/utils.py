@@ -1,4 +1,3 @@
-from collections import defaultdict
 from collections.abc import Mapping, Sequence
 
 import numpy as np
@@ -7,7 +6,8 @@ from sc2.position import Point2
 from sc2.unit import Unit
 
 from phantom.common.constants import MAX_UNIT_RADIUS
-from phantom.common.utils import air_dps_of, air_range_of, ground_dps_of, ground_range_of, pairwise_distances
+from phantom.common.unit_table import UnitTable
+from phantom.common.utils import pairwise_distances
 
 
 def medoid(points: Sequence[Point2]) -> Point2:
@@ -16,103 +16,76 @@ def medoid(points: Sequence[Point2]) -> Point2:
     return points[medoid_index]
 
 
-def get_shootable_targets(mediator: ManagerMediator, units: Sequence[Unit]) -> Mapping[Unit, Sequence[Unit]]:
-    units_filtered = list(filter(lambda u: ground_range_of(u) >= 2 and u.weapon_ready, units))
-
-    points_ground = list[Unit]()
-    points_air = list[Unit]()
-    distances_ground = list[float]()
-    distances_air = list[float]()
-    for unit in units_filtered:
-        base_range = unit.radius + MAX_UNIT_RADIUS
-        if unit.can_attack_ground:
-            points_ground.append(unit)
-            distances_ground.append(base_range + ground_range_of(unit))
-        if unit.can_attack_air:
-            points_air.append(unit)
-            distances_air.append(base_range + air_range_of(unit))
+def get_shootable_targets(
+    mediator: ManagerMediator, table: UnitTable, units: Sequence[Unit], require_weapon_ready: bool = True
+) -> Mapping[Unit, Sequence[Unit]]:
+    units_filtered = [
+        u for u in units if table.ground_range[table.rows[u.tag]] >= 2 and (u.weapon_ready or not require_weapon_ready)
+    ]
+    unit_rows = table.indices(units_filtered)
+    can_attack_ground = table.ground_dps[unit_rows] > 0
+    can_attack_air = table.air_dps[unit_rows] > 0
+    base_range = table.radius[unit_rows] + MAX_UNIT_RADIUS
 
     ground_candidates = mediator.get_units_in_range(
-        start_points=points_ground,
-        distances=distances_ground,
+        start_points=[u for u, ok in zip(units_filtered, can_attack_ground, strict=True) if ok],
+        distances=(base_range + table.ground_range[unit_rows])[can_attack_ground].tolist(),
         query_tree=UnitTreeQueryType.EnemyGround,
         return_as_dict=True,
     )
     air_candidates = mediator.get_units_in_range(
-        start_points=points_air,
-        distances=distances_air,
+        start_points=[u for u, ok in zip(units_filtered, can_attack_air, strict=True) if ok],
+        distances=(base_range + table.air_range[unit_rows])[can_attack_air].tolist(),
         query_tree=UnitTreeQueryType.EnemyFlying,
         return_as_dict=True,
     )
-    targets = defaultdict[Unit, list[Unit]](list)
-    for unit in units_filtered:
-        for target in ground_candidates.get(unit.tag, []):
-            if unit.distance_to(target) <= unit.radius + ground_range_of(unit) + target.radius:
-                targets[unit].append(target)
-        for target in air_candidates.get(unit.tag, []):
-            if unit.distance_to(target) <= unit.radius + air_range_of(unit) + target.radius:
-                targets[unit].append(target)
-    targets_sorted = {unit: sorted(ts, key=lambda u: u.tag) for unit, ts in targets.items()}
-    return targets_sorted
-
-
-def time_to_attack(mediator: ManagerMediator, units: Sequence[Unit], enemies: Sequence[Unit]) -> np.ndarray:
+    targets = dict[Unit, Sequence[Unit]]()
+    for unit, row in zip(units_filtered, unit_rows.tolist(), strict=True):
+        candidates = [*ground_candidates.get(unit.tag, []), *air_candidates.get(unit.tag, [])]
+        if not candidates:
+            continue
+        candidate_rows = table.indices(candidates)
+        distance = np.linalg.norm(table.position[candidate_rows] - table.position[row], axis=1)
+        weapon_range = np.where(table.flying[candidate_rows], table.air_range[row], table.ground_range[row])
+        in_range = distance <= table.radius[row] + weapon_range + table.radius[candidate_rows]
+        if in_range.any():
+            targets[unit] = sorted((t for t, ok in zip(candidates, in_range, strict=True) if ok), key=lambda u: u.tag)
+    return targets
+
+
+def time_to_attack(table: UnitTable, units: Sequence[Unit], enemies: Sequence[Unit]) -> np.ndarray:
     if not any(units) or not any(enemies):
         return np.array([])
 
-    ground_range = np.array([ground_range_of(u) for u in units])
-    air_range = np.array([air_range_of(u) for u in units])
-    radius = np.array([u.radius for u in units])
-    enemy_radius = np.array([u.radius for u in enemies])
-
-    def is_attackable(u: Unit) -> bool:
-        if u.is_burrowed or u.is_cloaked:
-            return mediator.get_is_detected(unit=u, by_enemy=u.is_mine)
-        return True
-
-    enemy_attackable = np.array([1.0 if is_attackable(u) else 0.0 for u in enemies])
-    enemy_flying = np.array([1.0 if u.is_flying else 0.0 for u in enemies])
-    enemy_ground = 1.0 - enemy_flying
-
-    ranges = np.outer(ground_range, enemy_attackable * enemy_ground) + np.outer(
-        air_range, enemy_attackable * enemy_flying
-    )
+    own = table.take(units)
+    other = table.take(enemies)
+    enemy_ground = other.attackable & ~other.flying
+    enemy_air = other.attackable & other.flying
+    ranges = np.outer(own.ground_range, enemy_ground) + np.outer(own.air_range, enemy_air)
 
-    distances = pairwise_distances(
-        [u.position for u in units],
-        [u.position for u in enemies],
-    )
+    distances = pairwise_distances(own.position, other.position)
     distances -= ranges
-    distances -= np.repeat(radius[:, None], len(enemies), axis=1)
-    distances -= np.repeat(enemy_radius[None, :], len(units), axis=0)
+    distances -= own.radius[:, None]
+    distances -= other.radius[None, :]
     distances = np.maximum(distances, 0.0)
 
-    movement_speed = np.array([1.4 * u.real_speed for u in units])
-    movement_speed = np.repeat(movement_speed[:, None], len(enemies), axis=1)
+    movement_speed = 1.4 * own.speed[:, None]
 
-    result = np.nan_to_num(np.divide(distances, movement_speed), nan=np.inf)
+    result = np.nan_to_num(np.divide(distances, movement_speed), nan=np.inf, posinf=np.inf)
     return result
 
 
-def time_to_kill(mediator: ManagerMediator, units: Sequence[Unit], enemies: Sequence[Unit]) -> np.ndarray:
+def time_to_kill(table: UnitTable, units: Sequence[Unit], enemies: Sequence[Unit]) -> np.ndarray:
     if not any(units) or not any(enemies):
         return np.array([])
 
-    ground_dps = np.array([ground_dps_of(u) for u in units])
-    air_dps = np.array([air_dps_of(u) for u in units])
-
-    def is_attackable(u: Unit) -> bool:
-        if u.is_burrowed or u.is_cloaked:
-            return mediator.get_is_detected(unit=u, by_enemy=u.is_mine)
-        return True
-
-    enemy_attackable = np.array([1.0 if is_attackable(u) else 0.0 for u in enemies])
-    enemy_flying = np.array([1.0 if u.is_flying else 0.0 for u in enemies])
-    enemy_ground = 1.0 - enemy_flying
-    dps = np.outer(ground_dps, enemy_attackable * enemy_ground) + np.outer(air_dps, enemy_attackable * enemy_flying)
+    own = table.take(units)
+    other = table.take(enemies)
+    enemy_ground = other.attackable & ~other.flying
+    enemy_air = other.attackable & other.flying
+    dps = np.outer(own.ground_dps, enemy_ground) + np.outer(own.air_dps, enemy_air)
 
-    enemy_hp = np.array([u.health + u.shield for u in enemies])
-    enemy_hp = np.repeat(enemy_hp[None, :], len(units), axis=0)
+    enemy_hp = np.repeat(other.hp[None, :], len(units), axis=0)
 
-    result = np.nan_to_num(np.divide(enemy_hp, dps), nan=np.inf)
+    result = np.nan_to_num(np.divide(enemy_hp, dps), nan=np.inf, posinf=np.inf)
     return result
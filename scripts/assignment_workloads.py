@@ -0,0 +1,118 @@
+import math
+from collections.abc import Callable
+
+import numpy as np
+from scipy.optimize import linprog
+from scipy.sparse import coo_array
+
+from phantom.common.distribute import AssignmentBackend, AssignmentProblem
+
+type Workload = Callable[[int, int, np.random.Generator], AssignmentProblem]
+
+
+def _distances(n: int, m: int, rng: np.random.Generator) -> np.ndarray:
+    sources = rng.uniform(0, 100, (n, 2))
+    targets = rng.uniform(0, 100, (m, 2))
+    return np.linalg.norm(sources[:, None] - targets[None], axis=2)
+
+
+def mining_problem(n: int, m: int, rng: np.random.Generator) -> AssignmentProblem:
+    """Harvesters to mineral fields and gas buildings, with a total constraint on gas harvesters."""
+    num_gas = max(1, m // 4)
+    is_gas = np.zeros(m)
+    is_gas[:num_gas] = 1.0
+    optimal_assigned = math.ceil(n / m)
+    limit = np.where(is_gas > 0, max(optimal_assigned, 3), max(optimal_assigned, 2)).astype(float)
+    gas_target = int(rng.integers(0, min(n, 3 * num_gas) + 1))
+    # mineral fields must fit the harvesters that do not go to gas
+    limit[num_gas:] = np.maximum(limit[num_gas:], math.ceil((n - gas_target) / (m - num_gas or 1)))
+    cost = _distances(n, m, rng) + rng.uniform(0, 10, m)
+    return AssignmentProblem(cost, limit, is_gas, gas_target)
+
+
+def targeting_problem(n: int, m: int, rng: np.random.Generator) -> AssignmentProblem:
+    """Army units to enemy units, with unreachable targets marked by inf."""
+    cost = _distances(n, m, rng) / rng.uniform(2, 5, (n, 1))
+    cost[rng.random((n, m)) < 0.2] = np.inf
+    # every unit can reach at least one target with capacity left
+    cost[np.arange(n), np.arange(n) % m] = np.nan_to_num(cost[np.arange(n), np.arange(n) % m], posinf=100.0)
+    limit = np.full(m, float(math.ceil(n / m)))
+    return AssignmentProblem(cost, limit)
+
+
+def inject_problem(n: int, m: int, rng: np.random.Generator) -> AssignmentProblem:
+    """Queens to townhalls, one to one."""
+    return AssignmentProblem(_distances(n, m, rng), np.ones(m))
+
+
+WORKLOADS: dict[str, Workload] = {
+    "mining": mining_problem,
+    "targeting": targeting_problem,
+    "inject": inject_problem,
+}
+
+
+def is_compatible(backend: AssignmentBackend, problem: AssignmentProblem) -> bool:
+    """Whether the backend is exact for this kind of problem, as opposed to dropping constraints."""
+    n, m = problem.shape
+    if problem.total_coeffs is not None and problem.total_coeffs.any():
+        return backend.name in {"highs", "pruned"}
+    elif backend.name == "nearest":
+        return bool((problem.limit >= n).all())
+    elif backend.name == "hungarian":
+        return bool((problem.limit == 1).all())
+    return True
+
+
+def _num_assigned(problem: AssignmentProblem) -> int:
+    n, m = problem.shape
+    return min(n, int(np.floor(problem.limit).sum()))
+
+
+def reference_cost(problem: AssignmentProblem) -> float:
+    """Optimal LP value, computed independently of the solvers under test."""
+    n, m = problem.shape
+    sources, targets = np.nonzero(np.isfinite(problem.cost))
+    num_edges = len(sources)
+    a_ub = coo_array(
+        (np.ones(2 * num_edges), (np.concatenate([sources, n + targets]), np.tile(np.arange(num_edges), 2)))
+    )
+    # assign as many sources as the targets have room for
+    a_eq = [np.ones(num_edges)]
+    b_eq = [_num_assigned(problem)]
+    if problem.total_coeffs is not None:
+        a_eq.append(problem.total_coeffs[targets])
+        b_eq.append(problem.total_limit)
+    result = linprog(
+        problem.cost[sources, targets],
+        A_ub=a_ub,
+        b_ub=np.concatenate([np.ones(n), problem.limit]),
+        A_eq=np.stack(a_eq),
+        b_eq=b_eq,
+        bounds=(0, 1),
+        method="highs",
+    )
+    if not result.success:
+        raise ValueError(f"Reference solve failed: {result.message}")
+    return float(result.fun)
+
+
+def check_assignment(problem: AssignmentProblem, indices: np.ndarray) -> float:
+    """Validate an assignment against the problem constraints and return its cost."""
+    n, m = problem.shape
+    if indices.shape != (n,):
+        raise ValueError(f"Expected {n} indices, got {indices.shape}")
+    assigned = np.flatnonzero(indices >= 0)
+    if len(assigned) < _num_assigned(problem):
+        raise ValueError(f"{n - len(assigned)} sources left unassigned")
+    cost = problem.cost[assigned, indices[assigned]]
+    if not np.isfinite(cost).all():
+        raise ValueError("Assignment uses an infeasible edge")
+    counts = np.bincount(indices[assigned], minlength=m)
+    if (counts > problem.limit).any():
+        raise ValueError(f"Target limit exceeded at {np.flatnonzero(counts > problem.limit)}")
+    if problem.total_coeffs is not None:
+        total = problem.total_coeffs[indices[assigned]].sum()
+        if total != problem.total_limit:
+            raise ValueError(f"Total is {total}, expected {problem.total_limit}")
+    return float(cost.sum())
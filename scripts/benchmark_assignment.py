@@ -0,0 +1,61 @@
+import time
+from dataclasses import replace
+
+import click
+import numpy as np
+from loguru import logger
+
+from phantom.common.distribute import BACKENDS, get_solver_cache, select_backend
+from scripts.assignment_workloads import WORKLOADS, check_assignment, is_compatible, reference_cost
+
+
+@click.command()
+@click.option("--sizes", default="8,16,32,64,128,256", help="Comma separated problem sizes.")
+@click.option("--targets", default=1.0, help="Number of targets relative to the problem size.")
+@click.option("--candidates", default=None, type=int, help="Candidate edges per source, as passed by the bot.")
+@click.option("--workload", "workloads", type=click.Choice(list(WORKLOADS)), multiple=True)
+@click.option("--backend", "backends", type=click.Choice(list(BACKENDS)), multiple=True)
+@click.option("--repeats", default=20)
+@click.option("--seed", default=42)
+def main(
+    sizes: str,
+    targets: float,
+    candidates: int | None,
+    workloads: list[str],
+    backends: list[str],
+    repeats: int,
+    seed: int,
+) -> None:
+    logger.remove()
+    rng = np.random.default_rng(seed)
+    print(f"{'workload':<10} {'size':>5} {'backend':<10} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'regret':>8}")
+    for workload in workloads or WORKLOADS:
+        for size in map(int, sizes.split(",")):
+            num_targets = max(1, round(targets * size))
+            problems = [
+                replace(WORKLOADS[workload](size, num_targets, rng), candidates=candidates) for _ in range(repeats)
+            ]
+            references = [reference_cost(p) for p in problems]
+            for backend in backends or BACKENDS:
+                if not all(is_compatible(BACKENDS[backend], p) for p in problems):
+                    continue
+                durations = []
+                regret = 0.0
+                for problem, reference in zip(problems, references, strict=True):
+                    start = time.perf_counter()
+                    indices = BACKENDS[backend].solve(problem)
+                    durations.append(time.perf_counter() - start)
+                    cost = check_assignment(problem, indices)
+                    regret = max(regret, (cost - reference) / max(abs(reference), 1e-9))
+                p50, p90, p99 = 1e3 * np.percentile(durations, [50, 90, 99])
+                selected = "*" if select_backend(problems[0]).name == backend else ""
+                print(
+                    f"{workload:<10} {size:>5} {backend + selected:<10} {p50:>8.2f} {p90:>8.2f} {p99:>8.2f} {regret:>8.1e}"
+                )
+    cache = get_solver_cache()
+    print(f"{cache.compile_count} HiGHS models compiled in {cache.compile_time:.2f}s")
+    print("* default backend for the workload")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import json
+import os
+import time
+import tracemalloc
+from collections.abc import Callable
+
+import click
+import numpy as np
+from loguru import logger
+
+from phantom.common.config import BotConfig
+from phantom.learn.parameters import ParameterManager
+from phantom.micro.combat import CombatParameters, CombatState
+from phantom.micro.simulator import CombatSetup, CombatSimulator, CombatSimulatorParameters, army_fingerprint
+from phantom.micro.utils import time_to_attack, time_to_kill
+from scripts.combat_workloads import COMPOSITIONS, SyntheticBattle, SyntheticBot, synthetic_battle
+
+type Stage = Callable[[], object]
+
+
+def stages(battle: SyntheticBattle, config: BotConfig) -> dict[str, Stage]:
+    bot = SyntheticBot(config, battle.table)
+    params = ParameterManager(1)
+    simulator = CombatSimulator(bot, CombatSimulatorParameters(params))
+    combat = CombatState(bot, CombatParameters(params), simulator)
+    units = [*battle.units1, *battle.units2]
+    n1 = len(battle.units1)
+    attacking = np.ones(len(units), dtype=bool)
+    setup = CombatSetup(battle.units1, battle.units2, {u.tag for u in units})
+    result = {
+        "time_to_attack": lambda: time_to_attack(battle.table, battle.units1, battle.units2),
+        "time_to_kill": lambda: time_to_kill(battle.table, battle.units1, battle.units2),
+        "assign_targets": lambda: combat._assign_targets(battle.units1, battle.units2),
+        "simulate_local": lambda: simulator._simulate_local(units, battle.table, n1, attacking),
+        "fingerprint": lambda: (
+            army_fingerprint(battle.units1, config.engage_cache_hp_buckets),
+            army_fingerprint(battle.units2, config.engage_cache_hp_buckets),
+        ),
+    }
+    # sc2_helper needs real units, the global outcome is only measured with the surrogate
+    if simulator.surrogate:
+        result["outcome_global"] = lambda: simulator._outcome_global(setup, battle.table, n1)
+    return result
+
+
+def measure(stage: Stage) -> tuple[float, float]:
+    """Duration and peak traced memory, measured in separate runs so that tracing does not affect the timing."""
+    start = time.perf_counter()
+    stage()
+    duration = time.perf_counter() - start
+    tracemalloc.start()
+    stage()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return duration, peak
+
+
+@click.command()
+@click.option("--sizes", default="10,25,50,100,200,400", help="Comma separated army sizes per side.")
+@click.option("--spread", default=5.0, help="Standard deviation of unit positions around each army center.")
+@click.option("--composition", type=click.Choice(list(COMPOSITIONS)), default="mixed")
+@click.option("--repeats", default=20)
+@click.option("--seed", default=42)
+@click.option("--surrogate", default=None, help="Surrogate model to measure the global outcome with.")
+@click.option(
+    "--baseline",
+    default="scripts/benchmark_combat_baseline.json",
+    help="Timings to compare against, machine specific and recorded with --save-baseline.",
+)
+@click.option("--save-baseline", is_flag=True, help="Overwrite the baseline with this run.")
+@click.option("--tolerance", default=1.5, help="Fail on stages slower than the baseline by this factor.")
+def main(
+    sizes: str,
+    spread: float,
+    composition: str,
+    repeats: int,
+    seed: int,
+    surrogate: str | None,
+    baseline: str,
+    save_baseline: bool,
+    tolerance: float,
+) -> None:
+    logger.remove()
+    rng = np.random.default_rng(seed)
+    config = BotConfig()
+    config.pathing_workers = 0
+    if surrogate:
+        config.combat_outcome_backend = "surrogate"
+        config.combat_surrogate_path = surrogate
+
+    reference = dict[str, dict[str, float]]()
+    if not save_baseline:
+        if not os.path.isfile(baseline):
+            raise click.ClickException(f"No baseline at {baseline}, record one with --save-baseline")
+        with open(baseline) as f:
+            reference = json.load(f)
+
+    results = dict[str, dict[str, float]]()
+    regressions = list[str]()
+    print(f"{'stage':<16} {'size':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'peak KiB':>9} {'vs base':>8}")
+    for size in map(int, sizes.split(",")):
+        durations = dict[str, list[float]]()
+        peaks = dict[str, list[float]]()
+        for _ in range(repeats):
+            battle = synthetic_battle(size, spread, composition, rng)
+            for name, stage in stages(battle, config).items():
+                duration, peak = measure(stage)
+                durations.setdefault(name, []).append(duration)
+                peaks.setdefault(name, []).append(peak)
+        for name in durations:
+            p50, p95, p99 = 1e3 * np.percentile(durations[name], [50, 95, 99])
+            peak = max(peaks[name]) / 1024
+            key = f"{name}/{size}"
+            results[key] = dict(p50=p50, p95=p95, p99=p99, peak=peak)
+            ratio = ""
+            if base := reference.get(key):
+                ratio = f"{p50 / base['p50']:.2f}x"
+                if p50 > tolerance * base["p50"]:
+                    ratio += "!"
+                    regressions.append(key)
+            print(f"{name:<16} {size:>5} {p50:>8.3f} {p95:>8.3f} {p99:>8.3f} {peak:>9.1f} {ratio:>8}")
+
+    if save_baseline:
+        with open(baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {baseline}")
+    elif regressions:
+        raise click.ClickException(
+            f"p50 slower than the baseline by more than {tolerance}x in {', '.join(regressions)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+import numpy as np
+from sc2.ids.unit_typeid import UnitTypeId
+from sc2.position import Point2
+
+from phantom.common.config import BotConfig
+from phantom.common.unit_table import UnitTable
+
+
+@dataclass(frozen=True)
+class Archetype:
+    type_id: UnitTypeId
+    health: float
+    shield: float
+    ground_dps: float
+    air_dps: float
+    ground_range: float
+    air_range: float
+    real_speed: float
+    radius: float
+    is_flying: bool = False
+
+
+ARCHETYPES = {
+    a.type_id: a
+    for a in [
+        Archetype(UnitTypeId.ZERGLING, 35, 0, 10.0, 0.0, 0.1, 0.0, 2.95, 0.375),
+        Archetype(UnitTypeId.ROACH, 145, 0, 11.2, 0.0, 4.0, 0.0, 2.25, 0.625),
+        Archetype(UnitTypeId.HYDRALISK, 90, 0, 22.4, 22.4, 5.0, 5.0, 2.25, 0.625),
+        Archetype(UnitTypeId.QUEEN, 175, 0, 11.2, 12.6, 5.0, 7.0, 0.94, 0.875),
+        Archetype(UnitTypeId.MUTALISK, 120, 0, 8.0, 8.0, 3.0, 3.0, 4.0, 0.5, is_flying=True),
+        Archetype(UnitTypeId.MARINE, 45, 0, 9.8, 9.8, 5.0, 5.0, 2.25, 0.375),
+        Archetype(UnitTypeId.MARAUDER, 125, 0, 9.3, 0.0, 6.0, 0.0, 2.25, 0.5625),
+        Archetype(UnitTypeId.ZEALOT, 100, 50, 18.6, 0.0, 0.1, 0.0, 2.25, 0.5),
+        Archetype(UnitTypeId.STALKER, 80, 80, 9.7, 9.7, 6.0, 6.0, 2.95, 0.625),
+        Archetype(UnitTypeId.VOIDRAY, 150, 100, 16.8, 16.8, 6.0, 6.0, 2.75, 1.0, is_flying=True),
+    ]
+}
+
+COMPOSITIONS = {
+    "zerg": [UnitTypeId.ZERGLING, UnitTypeId.ROACH, UnitTypeId.HYDRALISK, UnitTypeId.QUEEN, UnitTypeId.MUTALISK],
+    "terran": [UnitTypeId.MARINE, UnitTypeId.MARAUDER],
+    "protoss": [UnitTypeId.ZEALOT, UnitTypeId.STALKER, UnitTypeId.VOIDRAY],
+    "mixed": list(ARCHETYPES),
+}
+
+
+@dataclass(eq=False)
+class SyntheticUnit:
+    """Lightweight stand-in for the unit properties read by the combat hot path."""
+
+    tag: int
+    type_id: UnitTypeId
+    position: Point2
+    radius: float
+    health: float
+    health_max: float
+    shield: float
+    shield_max: float
+    real_speed: float
+    is_flying: bool
+    is_enemy: bool
+    attack_upgrade_level: int = 0
+    armor_upgrade_level: int = 0
+    shield_upgrade_level: int = 0
+
+
+@dataclass
+class SyntheticBot:
+    """The parts of the bot the combat simulator and target assignment read."""
+
+    bot_config: BotConfig
+    unit_table: UnitTable
+    time: float = 0.0
+
+
+@dataclass(frozen=True)
+class SyntheticBattle:
+    units1: Sequence[SyntheticUnit]
+    units2: Sequence[SyntheticUnit]
+    table: UnitTable
+
+
+def _army(
+    size: int, center: np.ndarray, spread: float, composition: str, is_enemy: bool, tag: int, rng: np.random.Generator
+) -> list[SyntheticUnit]:
+    archetypes = [ARCHETYPES[t] for t in rng.choice(COMPOSITIONS[composition], size)]
+    positions = center + rng.normal(0, spread, (size, 2))
+    health = rng.uniform(0.2, 1.0, size)
+    return [
+        SyntheticUnit(
+            tag=tag + i,
+            type_id=a.type_id,
+            position=Point2(p),
+            radius=a.radius,
+            health=h * a.health,
+            health_max=a.health,
+            shield=h * a.shield,
+            shield_max=a.shield,
+            real_speed=a.real_speed,
+            is_flying=a.is_flying,
+            is_enemy=is_enemy,
+        )
+        for i, (a, p, h) in enumerate(zip(archetypes, positions.tolist(), health.tolist(), strict=True))
+    ]
+
+
+def synthetic_table(units: Sequence[SyntheticUnit]) -> UnitTable:
+    archetypes = [ARCHETYPES[u.type_id] for u in units]
+    return UnitTable(
+        rows={u.tag: i for i, u in enumerate(units)},
+        position=np.array([u.position for u in units], dtype=float).reshape(-1, 2),
+        radius=np.array([u.radius for u in units]),
+        ground_range=np.array([a.ground_range for a in archetypes]),
+        air_range=np.array([a.air_range for a in archetypes]),
+        ground_dps=np.array([a.ground_dps for a in archetypes]),
+        air_dps=np.array([a.air_dps for a in archetypes]),
+        speed=np.array([u.real_speed for u in units]),
+        hp=np.array([u.health + u.shield for u in units]),
+        flying=np.array([u.is_flying for u in units], dtype=bool),
+        attackable=np.ones(len(units), dtype=bool),
+        enemy=np.array([u.is_enemy for u in units], dtype=bool),
+    )
+
+
+def synthetic_battle(size: int, spread: float, composition: str, rng: np.random.Generator) -> SyntheticBattle:
+    """Two armies of the given size, normally distributed around centers that are a few spreads apart."""
+    offset = np.array([spread + 5.0, 0.0])
+    units1 = _army(size, 100 - offset, spread, composition, False, 1, rng)
+    units2 = _army(size, 100 + offset, spread, composition, True, 1 + size, rng)
+    return SyntheticBattle(units1, units2, synthetic_table([*units1, *units2]))
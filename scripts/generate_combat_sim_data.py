@@ -1,5 +1,7 @@
 import json
+import os
 import random
+import time
 
 from sc2 import maps
 from sc2.bot_ai import BotAI
@@ -11,16 +13,20 @@ from sc2.unit import Unit
 from sc2.units import Units
 from sc2_helper.combat_simulator import CombatSimulator
 
+from phantom.common.utils import air_dps_of, air_range_of, ground_dps_of, ground_range_of
+from scripts.train_combat_surrogate import DATASET_PATH
+
 
 def serialize_unit(unit: Unit) -> dict:
+    # the same stats UnitTable feeds the surrogate at inference
     return dict(
         health=unit.health,
         shield=unit.shield,
-        movement_speed=unit.movement_speed,
-        ground_range=unit.ground_range,
-        ground_dps=unit.ground_dps,
-        air_range=unit.air_range,
-        air_dps=unit.air_dps,
+        real_speed=unit.real_speed,
+        ground_range=ground_range_of(unit),
+        ground_dps=ground_dps_of(unit),
+        air_range=air_range_of(unit),
+        air_dps=air_dps_of(unit),
         is_flying=unit.is_flying,
     )
 
@@ -47,7 +53,9 @@ class CombatSimBot(BotAI):
 
         elif iteration == 2:
             simulation_count = 10000
+            # labelled with the same settings as CombatSimulator._predict_engage
             sim = CombatSimulator()
+            sim.enable_timing_adjustment(True)
 
             results = []
             for _ in range(simulation_count):
@@ -55,17 +63,23 @@ class CombatSimBot(BotAI):
                 army1 = random.sample(self.units, army_size)
                 army2 = random.sample(self.enemy_units, army_size)
 
-                winner, health_remaining = sim.predict_engage(Units(army1, self), Units(army2, self))
+                start = time.perf_counter()
+                winner, health_remaining = sim.predict_engage(
+                    Units(army1, self), Units(army2, self), optimistic=True, defender_player=2
+                )
+                duration = time.perf_counter() - start
 
                 results.append(
                     dict(
                         army1=list(map(serialize_unit, army1)),
                         army2=list(map(serialize_unit, army2)),
                         result=health_remaining if winner else -health_remaining,
+                        duration=duration,
                     )
                 )
 
-            with open("../resources/datasets/combat.json", "w") as file:
+            os.makedirs(os.path.dirname(DATASET_PATH), exist_ok=True)
+            with open(DATASET_PATH, "w") as file:
                 json.dump(results, file, indent=4)
 
             await self.client.leave()
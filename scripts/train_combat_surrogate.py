@@ -0,0 +1,75 @@
+import json
+import lzma
+import pickle
+import time
+
+import click
+import numpy as np
+
+from phantom.micro.surrogate import ArmyStats, CombatSurrogate, combat_features
+
+# relative to the repository root, where the scripts are run from
+DATASET_PATH = "resources/datasets/combat.json"
+
+
+def army_stats(units: list[dict]) -> ArmyStats:
+    return ArmyStats(
+        hp=np.array([u["health"] + u["shield"] for u in units], dtype=float),
+        ground_dps=np.array([u["ground_dps"] for u in units], dtype=float),
+        air_dps=np.array([u["air_dps"] for u in units], dtype=float),
+        ground_range=np.array([u["ground_range"] for u in units], dtype=float),
+        air_range=np.array([u["air_range"] for u in units], dtype=float),
+        speed=np.array([u["real_speed"] for u in units], dtype=float),
+        flying=np.array([u["is_flying"] for u in units], dtype=bool),
+    )
+
+
+@click.command()
+@click.option("--dataset", default=DATASET_PATH, help="Output of generate_combat_sim_data.py.")
+@click.option("--output", default="models/combat.pkl.xz")
+@click.option("--holdout", default=0.2, help="Fraction of samples held out for evaluation.")
+@click.option("--seed", default=42)
+def main(dataset: str, output: str, holdout: float, seed: int) -> None:
+    with open(dataset) as f:
+        samples = json.load(f)
+
+    armies = [(army_stats(s["army1"]), army_stats(s["army2"])) for s in samples]
+    features = np.stack([combat_features(a1, a2) for a1, a2 in armies])
+    # normalize like CombatSimulator: remaining health relative to the winning army
+    outcomes = np.array(
+        [
+            s["result"] / max(1.0, (a1 if s["result"] > 0 else a2).hp.sum())
+            for s, (a1, a2) in zip(samples, armies, strict=True)
+        ]
+    )
+
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(samples))
+    num_test = int(holdout * len(samples))
+    test, train = order[:num_test], order[num_test:]
+
+    model = CombatSurrogate.fit(features[train], outcomes[train])
+    prediction = model.predict(features[test])
+    accuracy = np.mean(np.sign(prediction) == np.sign(outcomes[test]))
+    error = np.abs(prediction - outcomes[test])
+    print(f"{len(train)} training and {len(test)} held out samples")
+    print(f"winner accuracy {accuracy:.3f}, mean absolute error {error.mean():.3f}, p90 {np.percentile(error, 90):.3f}")
+
+    durations = []
+    for i in test:
+        start = time.perf_counter()
+        model.predict_engage(*armies[i])
+        durations.append(time.perf_counter() - start)
+    p50, p99 = 1e6 * np.percentile(durations, [50, 99])
+    print(f"surrogate latency p50 {p50:.1f}us, p99 {p99:.1f}us per call, including featurization")
+    if all("duration" in samples[i] for i in test):
+        p50, p99 = 1e6 * np.percentile([samples[i]["duration"] for i in test], [50, 99])
+        print(f"sc2_helper latency p50 {p50:.1f}us, p99 {p99:.1f}us per call")
+
+    with lzma.open(output, "wb") as f:
+        pickle.dump(model, f)
+    print(f"Wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import unittest
+
+import numpy as np
+
+from phantom.common.distribute import BACKENDS, select_backend
+from scripts.assignment_workloads import WORKLOADS, check_assignment, is_compatible, reference_cost
+
+
+class AssignmentWorkloadsTest(unittest.TestCase):
+    def setUp(self) -> None:
+        pass
+
+    def tearDown(self) -> None:
+        pass
+
+    def test_cross_check(self):
+        rng = np.random.default_rng(42)
+        for workload_name, workload in WORKLOADS.items():
+            for n, m in [(8, 8), (24, 8), (40, 40)]:
+                problem = workload(n, m, rng)
+                reference = reference_cost(problem)
+                self.assertTrue(is_compatible(select_backend(problem), problem))
+                for backend in BACKENDS.values():
+                    if not is_compatible(backend, problem):
+                        continue
+                    with self.subTest(workload=workload_name, n=n, m=m, backend=backend.name):
+                        cost = check_assignment(problem, backend.solve(problem))
+                        self.assertLessEqual(cost, reference + backend.last_gap + 1e-6)
+
+    def test_check_assignment(self):
+        problem = WORKLOADS["inject"](4, 4, np.random.default_rng(42))
+        check_assignment(problem, np.array([0, 1, 2, 3]))
+        with self.assertRaises(ValueError):
+            check_assignment(problem, np.array([0, 0, 2, 3]))
+        with self.assertRaises(ValueError):
+            check_assignment(problem, np.array([0, 1, 2, -1]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+
+from phantom.common.cache import LRUCache
+
+
+class CacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        pass
+
+    def tearDown(self) -> None:
+        pass
+
+    def test_eviction(self):
+        cache = LRUCache[str, int](2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.put("c", 3)
+        self.assertNotIn("b", cache)
+        self.assertIn("a", cache)
+        self.assertEqual(cache.evictions, 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_size_budget(self):
+        cache = LRUCache[str, list[int]](10, size_of=len)
+        cache.put("a", [0] * 4)
+        cache.put("b", [0] * 4)
+        cache.put("c", [0] * 4)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.size, 8)
+        cache.put("d", [0] * 20)
+        self.assertEqual(len(cache), 1)
+        self.assertIn("d", cache)
+
+    def test_ttl(self):
+        now = 0.0
+        cache = LRUCache[str, int](10, ttl=5.0, clock=lambda: now)
+        cache.put("a", 1)
+        now = 4.0
+        self.assertEqual(cache.get("a"), 1)
+        cache.put("b", 2)
+        now = 6.0
+        self.assertNotIn("a", cache)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("b"), 2)
+        self.assertEqual((cache.expirations, len(cache)), (1, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,24 @@
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 
-from phantom.common.distribute import get_assignment_solver
+from phantom.common.auction import auction_assignment
+from phantom.common.distribute import (
+    BACKENDS,
+    AssignmentProblem,
+    AssignmentRepair,
+    AssignmentSession,
+    HighsPySolver,
+    SolverCache,
+    distribute,
+    get_assignment_solver,
+    repair_assignment,
+    select_backend,
+    solve_assignment,
+    solve_clustered,
+    solve_pruned,
+)
 
 
 class DistributeTest(unittest.TestCase):
@@ -65,5 +81,311 @@ class DistributeTest(unittest.TestCase):
         solution_padded = get_assignment_solver(8, 8).solve(cost, limit)
         np.testing.assert_almost_equal(solution_padded, solution)
 
+    def test_without_total(self):
+        cost = np.array(
+            [
+                [0, 1, 1],
+                [1, 0, 1],
+                [1, 1, 0],
+            ],
+            dtype=float,
+        )
+        limit = np.array([1, 1, 1], dtype=float)
+        solution = HighsPySolver(8, 8, include_total=False).solve(cost, limit)
+        np.testing.assert_almost_equal(solution, np.eye(3))
+
+    def test_warm_start(self):
+        rng = np.random.default_rng(42)
+        warm = HighsPySolver(16, 16, warm_start=True)
+        cold = HighsPySolver(16, 16, warm_start=False)
+        cost = rng.random((12, 10))
+        limit = np.full(10, 2.0)
+        is_gas = np.zeros(10)
+        is_gas[:2] = 1.0
+        for i in range(10):
+            cost += 0.01 * rng.random(cost.shape)
+            gas_target = i % 3
+            warm.set_total(is_gas, gas_target)
+            cold.set_total(is_gas, gas_target)
+            result_warm = warm.solve(cost, limit)
+            result_cold = cold.solve(cost, limit)
+            np.testing.assert_almost_equal((cost * result_warm).sum(), (cost * result_cold).sum())
+            np.testing.assert_almost_equal((result_warm * is_gas).sum(), gas_target)
+            self.assertEqual(warm.last_solve.warm, i > 0)
+            self.assertFalse(cold.last_solve.warm)
+        self.assertEqual(warm.solve_count, 10)
+        self.assertLess(warm.iteration_count, cold.iteration_count)
+
+    def test_solver_cache(self):
+        cache = SolverCache(budget=HighsPySolver(8, 8).memory_estimate * 3)
+        cache.get((8, 8))
+        cache.get((8, 16))
+        self.assertEqual(cache.compile_count, 2)
+        self.assertIs(cache.get((8, 8)), cache.get((8, 8)))
+        self.assertEqual(cache.solvers.hits, 2)
+        cache.get((16, 16))
+        self.assertEqual(cache.compile_count, 3)
+        self.assertNotIn((8, 16), cache.solvers)
+        self.assertGreater(cache.compile_time, 0.0)
+
+    def test_pruned(self):
+        rng = np.random.default_rng(42)
+        cost = rng.random((40, 30))
+        limit = np.full(30, 2.0)
+        is_gas = np.zeros(30)
+        is_gas[:3] = 1.0
+        problem = get_assignment_solver(40, 30)
+        problem.set_total(is_gas, 4)
+        dense = problem.solve(cost, limit).argmax(axis=1)
+        pruned = solve_pruned(cost, limit, 30, is_gas, 4)
+        np.testing.assert_almost_equal(cost[np.arange(40), pruned].sum(), cost[np.arange(40), dense].sum())
+        self.assertEqual(is_gas[solve_pruned(cost, limit, 4, is_gas, 4)].sum(), 4)
+
+    def test_pruned_fallback(self):
+        cost = np.array(
+            [
+                [0, 1, 9],
+                [0, 1, 9],
+                [0, 1, 9],
+                [np.inf, np.inf, np.inf],
+            ],
+            dtype=float,
+        )
+        limit = np.array([1, 1, 1], dtype=float)
+        indices = solve_pruned(cost, limit, 1)
+        np.testing.assert_equal(sorted(indices[:3]), [0, 1, 2])
+        self.assertEqual(indices[3], -1)
+        assignment = distribute("abcd", "xyz", cost, max_assigned=1, candidates=1)
+        self.assertEqual(sorted(assignment.values()), ["x", "y", "z"])
+        self.assertNotIn("d", assignment)
+
+    def test_backends(self):
+        rng = np.random.default_rng(42)
+        for limit in [1.0, 2.0, 3.0, 20.0]:
+            cost = rng.random((20, 15))
+            cost[rng.random(cost.shape) < 0.1] = np.inf
+            problem = AssignmentProblem(cost, np.full(15, limit))
+            reference = solve_assignment(problem, backend="highs")
+            for backend in ["hungarian", "transport", "nearest", "pruned"]:
+                if backend == "hungarian" and limit != 1.0:
+                    continue
+                if backend == "nearest" and limit < 20.0:
+                    continue
+                with self.subTest(backend=backend, limit=limit):
+                    indices = solve_assignment(problem, backend=backend)
+                    assigned = indices >= 0
+                    self.assertTrue(np.isfinite(cost[assigned, indices[assigned]]).all())
+                    self.assertTrue((np.bincount(indices[assigned], minlength=15) <= limit).all())
+                    if limit > 1.0:
+                        np.testing.assert_almost_equal(
+                            cost[np.arange(20), indices].sum(),
+                            cost[np.arange(20), reference].sum(),
+                        )
+
+    def test_auction(self):
+        rng = np.random.default_rng(42)
+        cost = rng.random((30, 12))
+        cost[rng.random(cost.shape) < 0.1] = np.inf
+        problem = AssignmentProblem(cost, np.full(12, 3.0))
+        reference = cost[np.arange(30), solve_assignment(problem, backend="transport")].sum()
+        backend = BACKENDS["auction"]
+        indices = backend.solve(problem)
+        self.assertTrue(np.isfinite(cost[np.arange(30), indices]).all())
+        self.assertTrue((np.bincount(indices, minlength=12) <= 3).all())
+        self.assertLessEqual(cost[np.arange(30), indices].sum(), reference + backend.last_gap + 1e-9)
+        self.assertLess(backend.last_gap, 0.1)
+
+    def test_auction_deadline(self):
+        rng = np.random.default_rng(42)
+        cost = rng.random((100, 100))
+        result = auction_assignment(cost, deadline=0.0)
+        self.assertFalse(result.converged)
+        self.assertEqual(len(set(result.indices)), 100)
+        self.assertGreaterEqual(result.gap, 0.0)
+        reference = auction_assignment(cost)
+        self.assertTrue(reference.converged)
+        self.assertLessEqual(reference.gap, 1e-3 * np.ptp(cost) + 1e-9)
+        self.assertLessEqual(reference.cost, result.cost)
+
+    def test_auction_deadline_feasible(self):
+        # each source reaches only one target, a timed out auction must not hand it to another source
+        cost = np.full((4, 4), np.inf)
+        cost[np.arange(4), [1, 2, 3, 0]] = 1.0
+        cost[:, 0] = np.minimum(cost[:, 0], 0.5)
+        indices = BACKENDS["auction"].solve(AssignmentProblem(cost, np.ones(4), deadline=-1.0))
+        np.testing.assert_equal(indices, [1, 2, 3, 0])
+
+    def test_auction_overflow(self):
+        cost = np.random.default_rng(42).random((10, 10))
+        cost[:, :5] = np.finfo(float).max
+        with self.assertRaises(ValueError):
+            auction_assignment(cost)
+        indices = BACKENDS["auction"].solve(AssignmentProblem(cost, np.ones(10), deadline=0.003))
+        reference = solve_assignment(AssignmentProblem(cost, np.ones(10)), backend="transport")
+        np.testing.assert_equal(indices, reference)
+
+    def test_session(self):
+        rng = np.random.default_rng(42)
+        problems = [
+            (list(range(5)), list("abc"), rng.random((5, 3)), 1),
+            (list(range(4)), list("de"), rng.random((4, 2)), 1),
+            (list(range(6)), list("fgh"), rng.random((6, 3)), 2),
+            (list(range(6)), list("ij"), rng.random((6, 2)), 3),
+            (list(range(3)), list("klm"), rng.random((3, 3)), None),
+            ([], list("n"), np.zeros((0, 1)), None),
+        ]
+        executor = ThreadPoolExecutor(2)
+        self.addCleanup(executor.shutdown)
+        for session_executor, backend in [(None, None), (executor, None), (None, "highs")]:
+            session = AssignmentSession(session_executor)
+            futures = [
+                session.submit(a, b, cost, max_assigned=limit, backend=backend) for a, b, cost, limit in problems
+            ]
+            session.solve()
+            for future, (a, b, cost, limit) in zip(futures, problems, strict=True):
+                with self.subTest(executor=session_executor, backend=backend, b=b):
+                    self.assertEqual(future.result(), distribute(a, b, cost, max_assigned=limit))
+
+    def test_session_failure(self):
+        executor = ThreadPoolExecutor(2)
+        self.addCleanup(executor.shutdown)
+        for session_executor in [None, executor]:
+            session = AssignmentSession(session_executor)
+            future = session.submit(list(range(3)), list("ab"), np.ones((3, 2)), backend="invalid")
+            session.solve()
+            with self.subTest(executor=session_executor), self.assertRaises(KeyError):
+                future.result(timeout=2)
+
+    def test_clustered(self):
+        rng = np.random.default_rng(42)
+        sources = rng.normal(40, 12, (120, 2))
+        targets = rng.normal(60, 12, (60, 2))
+        weight = rng.uniform(1, 10, 60)
+        limit = np.full(60, 2.0)
+        cost = np.linalg.norm(sources[:, None] - targets[None], axis=2) + weight
+
+        indices = solve_clustered(sources, targets, cost, limit, 16.0)
+        self.assertTrue((indices >= 0).all())
+        self.assertTrue((np.bincount(indices, minlength=60) <= limit).all())
+        reference = solve_assignment(AssignmentProblem(cost, limit), backend="transport")
+        total = cost[np.arange(120), indices].sum()
+        self.assertLess(total, 1.05 * cost[np.arange(120), reference].sum())
+
+    def test_clustered_capability(self):
+        rng = np.random.default_rng(42)
+        # ground units next to air targets they cannot hit, with ground targets further away
+        sources = rng.uniform(0, 8, (40, 2))
+        targets = np.concatenate([rng.uniform(0, 8, (20, 2)), rng.uniform(40, 48, (20, 2))])
+        cost = np.linalg.norm(sources[:, None] - targets[None], axis=2)
+        cost[:, :20] = np.inf
+
+        indices = solve_clustered(sources, targets, cost, np.full(40, 2.0), 16.0)
+        self.assertTrue((indices >= 20).all())
+
+    def test_clustered_leftover(self):
+        rng = np.random.default_rng(42)
+        # spread out armies, a third of the sources cannot hit a fifth of the targets
+        sources = rng.normal(55, 40, (100, 2))
+        targets = rng.normal(145, 40, (100, 2))
+        cost = np.linalg.norm(sources[:, None] - targets[None], axis=2)
+        cost[np.ix_(rng.random(100) < 0.3, rng.random(100) < 0.2)] = np.inf
+        limit = np.ones(100)
+
+        for max_cluster_pairs in [256, 2**16]:
+            with self.subTest(max_cluster_pairs=max_cluster_pairs):
+                indices = solve_clustered(sources, targets, cost, limit, 16.0, max_cluster_pairs)
+                counts = np.bincount(indices[indices >= 0], minlength=100)
+                self.assertTrue((counts <= limit).all())
+                self.assertTrue(np.isfinite(cost[indices >= 0, indices[indices >= 0]]).all())
+                # no source is left out while it can reach a target with capacity left
+                self.assertFalse(np.isfinite(cost[np.ix_(indices < 0, counts < limit)]).any())
+
+        reference = solve_assignment(AssignmentProblem(cost, limit), backend="hungarian")
+        indices = solve_clustered(sources, targets, cost, limit, 16.0)
+        self.assertEqual((indices >= 0).sum(), (reference >= 0).sum())
+
+    def test_backend_dispatch(self):
+        cost = np.ones((4, 3))
+        self.assertEqual(select_backend(AssignmentProblem(cost, np.full(3, 2.0), deadline=0.003)).name, "auction")
+        self.assertEqual(select_backend(AssignmentProblem(cost, np.full(3, 1.0))).name, "hungarian")
+        self.assertEqual(select_backend(AssignmentProblem(cost, np.full(3, 2.0))).name, "transport")
+        self.assertEqual(select_backend(AssignmentProblem(cost, np.full(3, 4.0))).name, "nearest")
+        is_gas = np.array([1.0, 0.0, 0.0])
+        self.assertEqual(select_backend(AssignmentProblem(cost, np.full(3, 2.0), is_gas, 1)).name, "highs")
+        self.assertEqual(
+            select_backend(AssignmentProblem(cost, np.full(3, 2.0), is_gas, 1, candidates=2)).name,
+            "highs",
+        )
+        stats = []
+        distribute("abcd", "xyz", cost, max_assigned=1, stats_hook=stats.append)
+        self.assertEqual([s.backend for s in stats], ["hungarian"])
+        self.assertEqual((stats[0].n, stats[0].m), (4, 3))
+
+    def test_backend_routing(self):
+        rng = np.random.default_rng(0)
+
+        def route(n: int, m: int, limit: float, is_gas: bool = False) -> str:
+            total_coeffs = (np.arange(m) < m // 4).astype(float) if is_gas else None
+            problem = AssignmentProblem(rng.uniform(0, 1, (n, m)), np.full(m, limit), total_coeffs, 2, candidates=12)
+            return select_backend(problem).name
+
+        # harvesters to resources, with and without a cached solver for the shape
+        self.assertEqual(route(60, 20, 3.0, is_gas=True), "highs")
+        self.assertEqual(route(203, 65, 4.0, is_gas=True), "pruned")
+        get_assignment_solver(203, 65)
+        self.assertEqual(route(203, 65, 4.0, is_gas=True), "highs")
+        # army units to enemies, queens to townhalls
+        self.assertEqual(route(40, 40, 1.0), "hungarian")
+        self.assertEqual(route(64, 20, 4.0), "transport")
+        self.assertEqual(route(6, 3, 1.0), "hungarian")
+        self.assertEqual(route(1100, 1100, 1.0), "hungarian")
+        self.assertEqual(route(1100, 300, 4.0), "transport")
+        self.assertEqual(route(2000, 200, 10.0), "pruned")
+
+    def test_repair(self):
+        cost = np.array(
+            [
+                [0, 5, 5],
+                [5, 0, 5],
+                [0, 1, 5],
+                [5, 5, 0],
+            ],
+            dtype=float,
+        )
+        limit = np.array([1, 1, 2], dtype=float)
+        # the third source is new and its cheapest target is full, the first source moves over to make room
+        indices = repair_assignment(cost, limit, np.array([0, 1, -1, 2]))
+        np.testing.assert_equal(indices, [0, 1, 2, 2])
+        indices = repair_assignment(cost, np.array([1, 2, 2], dtype=float), np.array([0, 1, -1, 2]))
+        np.testing.assert_equal(indices, [0, 1, 1, 2])
+
+    def test_repair_drift(self):
+        rng = np.random.default_rng(42)
+        repair = AssignmentRepair[int, int](drift_threshold=0.1)
+        sources = list(range(20))
+        targets = list(range(10))
+        limit = np.full(10, 2.0)
+        cost = rng.random((20, 10))
+
+        def solve():
+            return distribute(sources, targets, cost, max_assigned=2)
+
+        previous = repair.update(sources, targets, cost, limit, {}, solve)
+        self.assertEqual((repair.solve_count, repair.repair_count), (1, 0))
+
+        # a source dies and another one is born
+        sources[3] = 20
+        cost[3] = rng.random(10)
+        assignment = repair.update(sources, targets, cost, limit, previous, solve)
+        self.assertEqual((repair.solve_count, repair.repair_count), (1, 1))
+        self.assertIn(20, assignment)
+        self.assertNotIn(3, assignment)
+        self.assertTrue((np.bincount(list(assignment.values()), minlength=10) <= 2).all())
+
+        # a reshuffled cost matrix leaves the repaired assignment far from optimal
+        cost = rng.random((20, 10))
+        repair.update(sources, targets, cost, limit, assignment, solve)
+        self.assertEqual((repair.solve_count, repair.repair_count), (2, 1))
+
     def tearDown(self):
         pass
@@ -0,0 +1,28 @@
+import unittest
+
+import numpy as np
+
+from phantom.common.graph import distance_components, graph_components
+
+
+class GraphTest(unittest.TestCase):
+    def setUp(self) -> None:
+        pass
+
+    def tearDown(self) -> None:
+        pass
+
+    def test_distance_components(self):
+        positions = np.array([(0.0, 0.0), (1.0, 0.0), (2.0, 0.5), (10.0, 10.0), (10.5, 10.0), (30.0, 0.0)])
+        labels = distance_components(positions, 1.5)
+        self.assertEqual(len(set(labels[:3])), 1)
+        self.assertEqual(labels[3], labels[4])
+        self.assertEqual(len(set(labels.tolist())), 3)
+        self.assertEqual(distance_components(np.zeros((0, 2)), 1.0).shape, (0,))
+
+        rng = np.random.default_rng(0)
+        positions = rng.uniform(0, 50, (40, 2))
+        adjacency = np.linalg.norm(positions[:, None] - positions[None], axis=2) <= 4.0
+        labels = distance_components(positions, 4.0)
+        components = {tuple(np.flatnonzero(labels == label).tolist()) for label in set(labels.tolist())}
+        self.assertEqual(components, graph_components(adjacency.astype(float)))
@@ -0,0 +1,80 @@
+import unittest
+
+import numpy as np
+from scipy.spatial.distance import cdist
+from scipy.stats import expon
+
+from phantom.micro.lanchester import lanchester_advantage, lanchester_advantage_sparse
+
+
+def lanchester_advantage_loop(dps, ranges, distance, speed, hp, times, exponent):
+    lancester1 = np.zeros((len(hp), len(times)))
+    lancester2 = np.zeros((len(hp), len(times)))
+    for i, ti in enumerate(times):
+        range_projection = ranges + speed[:, None] * ti
+        alive = hp > 0
+        valid = alive[:, None] & (distance <= range_projection) & (dps > 0)
+
+        offense = np.zeros_like(valid, dtype=float)
+        num_targets = valid.sum(axis=1, keepdims=True)
+        np.divide(valid, num_targets, where=num_targets != 0, out=offense)
+
+        strength = np.where(alive, 1.0, 0.0)
+        fire2 = strength @ (dps * offense)
+        forces2 = hp @ offense
+        count2 = strength @ offense
+        potential2 = fire2 * forces2 * np.power(np.maximum(1e-10, count2), exponent - 2)
+
+        valid_sym = valid | valid.T
+        mix = valid_sym / np.maximum(1, valid_sym.sum(0, keepdims=True))
+        lancester1[:, i] = potential2 @ mix
+        lancester2[:, i] = potential2
+    return (lancester1 - lancester2).mean(1)
+
+
+def random_battle(n1: int, n2: int, rng: np.random.Generator) -> tuple[np.ndarray, ...]:
+    n = n1 + n2
+    positions = rng.uniform(0, 30, (n, 2))
+    dps = rng.uniform(0, 20, (n, n)) * (rng.random((n, n)) < 0.8)
+    dps[:n1, :n1] = 0.0
+    dps[n1:, n1:] = 0.0
+    ranges = rng.uniform(0, 7, (n, 1)) + rng.uniform(0.3, 1.0, (1, n))
+    speed = np.where(rng.random(n) < 0.5, rng.uniform(2, 5, n), 0.0)
+    hp = rng.uniform(30, 200, n) * (rng.random(n) < 0.9)
+    return dps, ranges, cdist(positions, positions), speed, hp
+
+
+class LanchesterTest(unittest.TestCase):
+    def setUp(self) -> None:
+        pass
+
+    def tearDown(self) -> None:
+        pass
+
+    def test_matches_loop(self):
+        rng = np.random.default_rng(0)
+        times = expon(scale=1.0).ppf(np.linspace(0.0, 1.0, 10, endpoint=False))
+        for n1, n2 in [(1, 1), (5, 12), (30, 20), (0, 3)]:
+            dps, ranges, distance, speed, hp = random_battle(n1, n2, rng)
+            expected = lanchester_advantage_loop(dps, ranges, distance, speed, hp, times, 1.5)
+            args = dps, ranges, distance, speed, hp, times, 1.5, n1
+            with self.subTest(n1=n1, n2=n2):
+                np.testing.assert_allclose(lanchester_advantage(*args), expected, rtol=1e-9, atol=1e-9)
+                np.testing.assert_allclose(
+                    lanchester_advantage(*args, dtype=np.float32), expected, rtol=1e-4, atol=1e-3
+                )
+
+    def test_sparse(self):
+        rng = np.random.default_rng(1)
+        times = expon(scale=1.0).ppf(np.linspace(0.0, 1.0, 10, endpoint=False))
+        for n1, n2 in [(1, 1), (5, 12), (30, 20), (0, 3)]:
+            dps, ranges, distance, speed, hp = random_battle(n1, n2, rng)
+            expected = lanchester_advantage(dps, ranges, distance, speed, hp, times, 1.5, n1)
+            # leave out some pairs that can never engage within the simulated time
+            gap = distance - ranges
+            attacker, target = np.nonzero((dps > 0) & (gap <= speed[:, None] * times.max() + 1.0))
+            sparse = lanchester_advantage_sparse(
+                attacker, target, dps[attacker, target], gap[attacker, target], speed, hp, times, 1.5
+            )
+            with self.subTest(n1=n1, n2=n2):
+                np.testing.assert_allclose(sparse, expected, rtol=1e-9, atol=1e-9)
@@ -0,0 +1,164 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import numpy as np
+
+from phantom.micro.pathing import FieldCache, FieldScheduler, FlowField, are_positions_safe, get_waypoints
+
+
+class PathingTest(unittest.TestCase):
+    def setUp(self) -> None:
+        pass
+
+    def tearDown(self) -> None:
+        pass
+
+    def test_field_cache(self):
+        computed = []
+
+        def compute(grid, targets):
+            computed.append(targets)
+            return FlowField.compute(grid, targets)
+
+        cache = FieldCache(compute)
+        grid = np.ones((8, 8))
+        field = cache.get("ground", grid, [(1, 1), (2, 2)])
+        self.assertIs(cache.get("ground", grid.copy(), [(1, 1), (2, 2)]), field)
+        cache.get("ground", grid, [(1, 1)])
+        cache.get("air", grid, [(1, 1)])
+        grid[3, 3] = 2.0
+        cache.get("ground", grid, [(1, 1), (2, 2)])
+        self.assertEqual(len(computed), 4)
+        self.assertEqual(cache.revisions, {"ground": 1, "air": 0})
+        self.assertEqual((cache.hits, cache.misses), (1, 4))
+
+    def test_field_scheduler(self):
+        rng = np.random.default_rng(0)
+        grid = rng.uniform(1, 2, (64, 64))
+        cache = FieldCache(FlowField.compute)
+        names = ["ground", "air", "attack", "retreat"]
+        with ThreadPoolExecutor(2) as executor:
+            scheduler = FieldScheduler(executor)
+            for i, name in enumerate(names):
+                scheduler.schedule(name, partial(cache.get, name, grid, [(i, i)]))
+            self.assertIn("air", scheduler)
+            for i, name in enumerate(names):
+                future = scheduler.take(name)
+                assert future is not None
+                field = future.result()
+                np.testing.assert_allclose(field.distance, FlowField.compute(grid, np.array([(i, i)])).distance)
+                self.assertNotIn(name, scheduler)
+        self.assertEqual(cache.misses, len(names))
+        self.assertIsNone(scheduler.take("ground"))
+
+        scheduler = FieldScheduler()
+        scheduler.schedule("ground", partial(cache.get, "ground", grid, [(0, 0)]))
+        self.assertIsNone(scheduler.take("ground"))
+
+    def test_flow_field(self):
+        grid = np.ones((6, 6))
+        grid[2, :5] = np.inf
+        field = FlowField.compute(grid, np.array([(0, 0)]))
+        path = field.get_path((5.5, 0.5))
+        self.assertEqual(path[0], (5, 0))
+        self.assertEqual(path[-1], (0, 0))
+        self.assertTrue(all(np.isfinite(grid[p]) for p in path))
+        self.assertEqual(len(field.get_path((5.5, 0.5), limit=3)), 3)
+        self.assertTrue(np.isinf(field.distance[2, 0]))
+        self.assertAlmostEqual(field.distance[0, 1], 1.0)
+
+    def test_waypoints(self):
+        rng = np.random.default_rng(0)
+        grid = rng.uniform(1, 3, (32, 32))
+        grid[rng.random(grid.shape) < 0.2] = np.inf
+        field = FlowField.compute(grid, np.array([(3, 4), (20, 25)]))
+        starts = np.concatenate((rng.uniform(0, 32, (50, 2)), [(-1.0, 5.0), (40.0, 3.0)]))
+        for limit in (0, 1, 3, 10):
+            paths = [field.get_path(tuple(start), limit) for start in starts]
+            waypoints, lengths = field.get_waypoints(starts, limit)
+            self.assertEqual(waypoints.tolist(), [list(path[-1]) for path in paths])
+            self.assertEqual(lengths.tolist(), [len(path) for path in paths])
+
+        class PathOnly:
+            get_path = field.get_path
+
+        waypoints, lengths = get_waypoints(PathOnly(), starts, 3)
+        np.testing.assert_array_equal(waypoints, field.get_waypoints(starts, 3)[0])
+        np.testing.assert_array_equal(lengths, field.get_waypoints(starts, 3)[1])
+
+    def test_are_positions_safe(self):
+        grid = np.ones((8, 8))
+        grid[2, 3] = 5.0
+        grid[4, 4] = np.inf
+        positions = np.array([(0.5, 0.5), (2.9, 3.1), (4.5, 4.5), (9.0, -1.0)])
+        np.testing.assert_array_equal(are_positions_safe(grid, positions), [True, False, True, True])
+        np.testing.assert_array_equal(are_positions_safe(grid, positions, 6.0), [True, True, True, True])
+        self.assertEqual(are_positions_safe(grid, np.array([])).shape, (0,))
+
+    def test_flow_field_local_repair(self):
+        grid = np.ones((60, 60))
+        field = FlowField.compute(grid, np.array([(0, 0)]))
+        grid[50, 50] = 5.0
+        repaired = field.repair(grid, np.array([(0, 0)]))
+        self.assertLess(repaired.touched, 200)
+        np.testing.assert_allclose(repaired.distance, FlowField.compute(grid, np.array([(0, 0)])).distance)
+
+    def test_flow_field_repair_fallback(self):
+        grid = np.ones((60, 60))
+        field = FlowField.compute(grid, np.array([(0, 0)]))
+        self.assertIsNone(field.repair(grid, np.array([(59, 59)])))
+
+        cache = FieldCache(FlowField.compute, FlowField.repair)
+        cache.get("ground", grid, [(0, 0)])
+        cache.get("ground", grid, [(59, 59)])
+        grid[50, 50] = 5.0
+        field = cache.get("ground", grid, [(59, 59)])
+        np.testing.assert_allclose(field.distance, FlowField.compute(grid, np.array([(59, 59)])).distance)
+        self.assertEqual((cache.repair_count, cache.fallback_count), (1, 1))
+
+    def test_bounded_flow_field(self):
+        rng = np.random.default_rng(42)
+        grid = np.where(rng.random((120, 120)) < 0.1, np.inf, 1.0)
+        targets = np.array([(60, 60), (62, 58)])
+        queries = np.array([(70, 75), (50, 52)])
+        grid[tuple(queries.T)] = 1.0
+        field = FlowField.compute(grid, targets)
+        bounded = FlowField.compute_bounded(grid, targets, queries)
+        np.testing.assert_allclose(bounded.distance[tuple(queries.T)], field.distance[tuple(queries.T)])
+        self.assertEqual(bounded.get_path(queries[0], 4), field.get_path(queries[0], 4))
+        self.assertLess(bounded.touched, grid.size // 4)
+        capped = FlowField.compute_bounded(grid, targets, queries, limit=5.0)
+        self.assertTrue((capped.distance[np.isfinite(capped.distance)] <= 5.0).all())
+        empty = FlowField.compute_bounded(grid, targets, [])
+        self.assertEqual(empty.distance[tuple(targets.T)].tolist(), [0.0, 0.0])
+
+        # a query on a wall and one walled in do not grow the search to the whole grid
+        grid[100, 100] = np.inf
+        grid[8:13, 8:13] = np.inf
+        grid[10, 10] = 1.0
+        unreachable = np.array([(100, 100), (10, 10)])
+        blocked = FlowField.compute_bounded(grid, targets, np.concatenate([queries, unreachable]))
+        np.testing.assert_allclose(blocked.distance[tuple(queries.T)], field.distance[tuple(queries.T)])
+        self.assertLess(blocked.touched, grid.size // 4)
+
+    def test_flow_field_repair(self):
+        rng = np.random.default_rng(42)
+        for _ in range(20):
+            grid = np.where(rng.random((30, 20)) < 0.15, np.inf, rng.uniform(1, 4, (30, 20)))
+            targets = rng.integers(0, (30, 20), (3, 2))
+            field = FlowField.compute(grid, targets)
+            changed = grid.copy()
+            cells = rng.integers(0, 30, 6), rng.integers(0, 20, 6)
+            changed[cells] = np.where(rng.random(6) < 0.3, np.inf, rng.uniform(1, 6, 6))
+            targets[0] = rng.integers(0, (30, 20))
+            repaired = field.repair(changed, targets, max_fraction=1.0)
+            reference = FlowField.compute(changed, targets)
+            np.testing.assert_allclose(repaired.distance, reference.distance)
+            self.assertLessEqual(repaired.touched, grid.size)
+            valid = repaired.forward >= 0
+            self.assertTrue((repaired.distance.flat[repaired.forward[valid]] < repaired.distance[valid]).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
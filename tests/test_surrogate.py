@@ -0,0 +1,48 @@
+import unittest
+
+import numpy as np
+
+from phantom.micro.surrogate import ArmyStats, CombatSurrogate, combat_features
+
+
+def random_army(rng: np.random.Generator) -> ArmyStats:
+    n = int(rng.integers(1, 20))
+    return ArmyStats(
+        hp=rng.uniform(30, 200, n),
+        ground_dps=rng.uniform(5, 20, n),
+        air_dps=rng.uniform(0, 10, n),
+        ground_range=rng.uniform(0, 6, n),
+        air_range=rng.uniform(0, 6, n),
+        speed=rng.uniform(2, 4, n),
+        flying=rng.random(n) < 0.2,
+    )
+
+
+def square_law(army1: ArmyStats, army2: ArmyStats) -> float:
+    strength1 = army1.hp.sum() * army1.ground_dps.sum()
+    strength2 = army2.hp.sum() * army2.ground_dps.sum()
+    return float(np.tanh(np.log(strength1 / strength2)))
+
+
+class SurrogateTest(unittest.TestCase):
+    def setUp(self) -> None:
+        pass
+
+    def tearDown(self) -> None:
+        pass
+
+    def test_fit(self):
+        rng = np.random.default_rng(0)
+        battles = [(random_army(rng), random_army(rng)) for _ in range(500)]
+        features = np.stack([combat_features(a1, a2) for a1, a2 in battles])
+        outcomes = np.array([square_law(a1, a2) for a1, a2 in battles])
+        model = CombatSurrogate.fit(features[:400], outcomes[:400])
+        prediction = model.predict(features[400:])
+        self.assertGreater(np.mean(np.sign(prediction) == np.sign(outcomes[400:])), 0.9)
+
+        army1, army2 = battles[0]
+        self.assertAlmostEqual(model.predict_engage(army1, army2), -model.predict_engage(army2, army1))
+
+
+if __name__ == "__main__":
+    unittest.main()